@@ -1,17 +1,92 @@
-import json
-from datetime import datetime
-from typing import List
-
-import pandas as pd
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import List, Literal
+
+import numpy as np
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from db import (
+    IntegrityError,
+    PoolTimeout,
+    open_db,
+    close_db,
+    run_in_db_executor,
+    fetch_data,
+    afetch_data,
+    astream_data,
+    ainsert_data,
+    aexec_table,
+)
+from compression import CompressionMiddleware
+from conversion import Rates
+from events import event_broker
+from conditional import (
+    not_modified,
+    row_validators,
+    table_validators,
+    validator_headers,
+)
+from bulk import lookup, upsert
+from cache import caches, user_cache, group_cache, currency_cache, rate_cache
+from group_counts import group_counts, group_key
+from metrics import MetricsMiddleware, render
+from pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, page
+from querylog import QueryContextMiddleware, query_log
+from schema import (
+    User,
+    Group,
+    Location,
+    Currency,
+    GroupUser,
+    BulkStatus,
+    GroupUserKey,
+    UserLookup,
+    GroupUserLookup,
+    Settlement,
+    Conversion,
+    UserPatch,
+    GroupPatch,
+    CurrencyPatch,
+    GroupUserPatch,
+    UpdateCount,
+    ConversionResult,
+    CustomerReport,
+    IntroducerReport,
+    LocationReport,
+    MonthlyReport,
+)
+from serializers import OmitNullsMiddleware, Serializer, serializer
+from reports import get_report, invalidate_reports
+from search import user_search
+from settlement import MissingRates, settle
+from static import StaticAssets
+from statements import (
+    user_statements,
+    group_statements,
+    location_statements,
+    currency_statements,
+    groupuser_statements,
+    reconcile,
+)
 
-from db import fetch_data, insert_data, exec_table
-from schema import User, Group, Location, Currency, GroupUser
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(static_assets.load)
+    open_db()
+    await run_in_db_executor(reconcile, fetch_data)
+    await run_in_db_executor(group_counts.rebuild)
+    await run_in_db_executor(user_search.rebuild)
+    yield
+    close_db()
+
+
+static_assets = StaticAssets()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,99 +94,261 @@ app.add_middleware(
     allow_headers=["*"],
     allow_methods=["*"],
     allow_origins=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(OmitNullsMiddleware)
+app.add_middleware(QueryContextMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(IntegrityError)
+async def integrity_error_handler(request: Request, exc: IntegrityError):
+    """
+    Writes rely on constraints instead of checking first, so a violation
+    means the request conflicts with existing data.
+    """
+
+    return JSONResponse(
+        status_code=409, content={"detail": "Record conflicts with existing data."}
+    )
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    """
+    Every DB connection stayed busy for DB_POOL_TIMEOUT, the server is
+    overloaded rather than broken, so clients may retry.
+    """
+
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, try again later."},
+        headers={"Retry-After": "1"},
+    )
+
 
-NUM_COLS = json.load(open("./num_cols.json", "r"))
+MAX_BULK_SIZE = 1000
 
 
-@app.get("/")
-async def index():
-    return FileResponse("build/index.html")
+def parse_fields(model, fields: str | None) -> tuple[str, ...] | None:
+    """
+    Turn the comma-separated [fields] query parameter into [model]'s field
+    names in model order, or None when every field is wanted
+    """
+
+    if fields is None:
+        return None
+
+    names = {k.strip() for k in fields.split(",") if k.strip()}
+    if not names:
+        raise HTTPException(status_code=400, detail="No fields selected.")
+    unknown = names - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields {', '.join(sorted(unknown))}."
+        )
+
+    return tuple(k for k in model.model_fields if k in names)
+
+
+def check_bulk(records: list, keys: tuple[str, ...]) -> None:
+    if len(records) > MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_SIZE} records per request, got {len(records)}.",
+        )
+
+    seen = set()
+    for record in records:
+        key = tuple(record.__dict__[k] for k in keys)
+        if key in seen:
+            raise HTTPException(status_code=400, detail=f"Duplicate record {key}.")
+        seen.add(key)
+
+
+def parse_group_date(group_date: str) -> datetime:
+    try:
+        return group_key(group_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid group date {group_date}.")
+
+
+def check_lookup(keys: list) -> None:
+    if len(keys) > MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_SIZE} keys per request, got {len(keys)}.",
+        )
+
+
+def lookup_response(model, found: list[dict], missing: list) -> Response:
+    record = serializer(model).json_record()
+    content = {"found": [record(row) for row in found], "missing": missing}
+
+    return Response(orjson.dumps(content), media_type="application/json")
+
+
+async def patch_row(statements, patch, key_values: list) -> tuple[dict, tuple[str, ...], int]:
+    """
+    UPDATE only the fields set in [patch] of the row with [key_values], in
+    the order of [statements].keys. Key fields may be repeated in [patch] but
+    not changed. Returns the changes, their columns and the updated row count.
+    """
+
+    changes = patch.model_dump(exclude_unset=True)
+    for k, v in zip(statements.keys, key_values):
+        if k in changes:
+            given = changes.pop(k)
+            if isinstance(given, datetime):
+                given = group_key(given)
+            if given != v:
+                raise HTTPException(status_code=404, detail=f"{k} {v} and {given} not matched.")
+
+    fixed = changes.keys() - set(statements.columns)
+    if fixed:
+        raise HTTPException(status_code=400, detail=f"Cannot update {', '.join(sorted(fixed))}.")
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update.")
+
+    columns = tuple(k for k in statements.set_columns if k in changes)
+    params = statements.update_params(changes, key_values, datetime.now(), columns)
+    updated = await aexec_table(statements.update_columns(columns), params)
+
+    return changes, columns, updated
+
+
+def group_event(op: str, group: dict | None = None, group_date=None) -> None:
+    group_date = group_date or group["出團日期"]
+    row = None
+    if group is not None:
+        row = serializer(Group).compact_record({**group, "客戶總數": group_counts.get(group_date)})
+    event_broker.publish("groups", op, group_date, row=row)
+
+
+def groupuser_event(op: str, user_id: str, group_date, group_user: dict | None = None) -> None:
+    row = None if group_user is None else serializer(GroupUser).compact_record(group_user)
+    event_broker.publish("groupusers", op, group_date, {"客戶ID": user_id}, row)
 
 
 @app.get("/api/users/", tags=["user"])
-def get_users() -> List[User]:
+async def get_users(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+) -> List[User]:
     """
     Get all users in T_客戶
+
+    Without [limit] every user is returned. With [limit], users are returned
+    ordered by ID and the X-Next-Cursor response header holds the [cursor]
+    for the next page (absent on the last page). [fields] is a comma-separated
+    list of the columns to return, all of them by default.
     """
 
-    sql = "SELECT * FROM PRAISE.dbo.T_客戶"
-    df = fetch_data(sql)
-    if df is None:
-        raise HTTPException(status_code=404, detail="No User in DB.")
+    fields = parse_fields(User, fields)
+    columns = user_statements.projection(fields, ("ID",))
 
-    output = []
-    for i in df.index:
-        output.append({k: df[k].iloc[i] for k in User.__fields__.keys()})
+    validators = await table_validators("T_客戶", request.url.query)
+    if response := not_modified(request, *validators):
+        return response
 
-    return output
+    if limit is None:
+        rows = await afetch_data(f"SELECT {columns} FROM PRAISE.dbo.T_客戶")
+        if rows is None:
+            raise HTTPException(status_code=404, detail="No User in DB.")
+
+        return serializer(User, fields).response(
+            rows, headers=validator_headers(*validators)
+        )
+
+    if cursor is None:
+        sql = f"SELECT TOP (%d) {columns} FROM PRAISE.dbo.T_客戶 ORDER BY ID"
+        params = (limit + 1,)
+    else:
+        (last_id,) = decode_cursor(cursor, 1)
+        if not isinstance(last_id, str):
+            raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}.")
+        sql = f"SELECT TOP (%d) {columns} FROM PRAISE.dbo.T_客戶 WHERE ID > %s ORDER BY ID"
+        params = (limit + 1, last_id)
+
+    rows, headers = page(await afetch_data(sql, params), limit, ("ID",))
+    headers.update(validator_headers(*validators))
+
+    return serializer(User, fields).response(rows, headers=headers)
+
+
+@app.get("/api/users/search", tags=["user"])
+async def search_users(
+    q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)
+) -> List[User]:
+    """
+    Get up to [limit] users in T_客戶 whose ID, 姓名, 電話, 手機 or 介紹人
+    contain every term of [q], best matches first
+
+    Served from an in-memory index, phone numbers match on their digits
+    alone and near misses are returned when there are too few matches.
+    """
+
+    return serializer(User).response(user_search.search(q, limit))
 
 
 @app.get("/api/user/", tags=["user"])
-def get_user_by_id(user_id: str) -> User:
+async def get_user_by_id(request: Request, user_id: str) -> User:
     """
     Get user with [user_id] in T_客戶
     """
 
-    sql = f"SELECT * FROM PRAISE.dbo.T_客戶 WHERE ID = '{user_id}'"
-    df = fetch_data(sql)
-    if df is None:
+    rows = await user_cache.get_or_load(
+        user_id, lambda: afetch_data(user_statements.select_by_key, (user_id,))
+    )
+    if rows is None:
         raise HTTPException(
             status_code=404, detail=f"User with ID {user_id} not found."
         )
 
-    output = {k: df[k].iloc[0] for k in User.__fields__.keys()}
+    validators = row_validators("T_客戶", rows[0])
+    if response := not_modified(request, *validators):
+        return response
 
-    return output
+    return serializer(User).response_one(rows[0], headers=validator_headers(*validators))
 
 
 @app.post("/api/user/", tags=["user"])
-def create_user(user: User):
+async def create_user(user: User):
     """
     Create new user in T_客戶
     """
 
     user_id = user.__dict__["ID"]
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_客戶 WHERE ID = '{user_id}'"
-    df = fetch_data(fetch_sql)
-    if df is not None:
+
+    data = user_statements.insert_params(user.__dict__, datetime.now())
+
+    if not await ainsert_data(user_statements.insert, data):
         raise HTTPException(
             status_code=404, detail=f"User with ID {user_id} already exists."
         )
-
-    cols = list(User.__fields__.keys())
-    types = ",".join(["%d" if col in NUM_COLS["T_客戶"] else "%s" for col in cols])
-    sql = f"""
-        INSERT INTO PRAISE.dbo.T_客戶 ({", ".join(cols)}, add_time, add_user_id, update_time, update_user_id)
-        values ({types}, %s, %d, %s, %d)
-    """
-
-    data = [user.__dict__[k] for k in User.__fields__.keys()]
-    data.extend([datetime.now(), 6, datetime.now(), 6])
-
-    insert_data(sql, data)
+    user_cache.invalidate(user_id)
+    user_search.put(user.__dict__)
 
 
 @app.delete("/api/user/", tags=["user"])
-def delete_user(user_id: str):
+async def delete_user(user_id: str):
     """
     Delete user with [user_id] in T_客戶
     """
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_客戶 WHERE ID = '{user_id}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    if not await aexec_table(user_statements.delete, (user_id,)):
         raise HTTPException(
             status_code=404, detail=f"User with ID {user_id} not found."
         )
-
-    sql = f"DELETE FROM PRAISE.dbo.T_客戶 WHERE ID = '{user_id}'"
-
-    exec_table(sql)
+    user_cache.invalidate(user_id)
+    user_search.remove(user_id)
 
 
 @app.put("/api/user/", tags=["user"])
-def update_user(user_id: str, user: User):
+async def update_user(user_id: str, user: User):
     """
     Update user with [user_id] in T_客戶
     """
@@ -122,134 +359,190 @@ def update_user(user_id: str, user: User):
             detail=f"User ID {user_id} and {user.__dict__['ID']} not matched.",
         )
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_客戶 WHERE ID = '{user_id}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    data = user_statements.update_params(user.__dict__, [user_id], datetime.now())
+
+    if not await aexec_table(user_statements.update, data):
         raise HTTPException(
             status_code=404, detail=f"User with ID {user_id} not found."
         )
+    user_cache.invalidate(user_id)
+    user_search.put(user.__dict__)
+
+
+@app.patch("/api/user/", tags=["user"])
+async def patch_user(user_id: str, user: UserPatch) -> UpdateCount:
+    """
+    Update only the fields given for user with [user_id] in T_客戶
+    """
+
+    changes, _, updated = await patch_row(user_statements, user, [user_id])
+    if not updated:
+        raise HTTPException(
+            status_code=404, detail=f"User with ID {user_id} not found."
+        )
+    user_cache.invalidate(user_id)
+    user_search.patch(user_id, changes)
+
+    return {"updated": updated}
+
+
+@app.post("/api/users/bulk", tags=["user"])
+async def bulk_upsert_users(users: List[User]) -> List[BulkStatus]:
+    """
+    Create or update many users in T_客戶 in one transaction
+
+    Returns the status of each user by its position in the request.
+    """
+
+    check_bulk(users, ("ID",))
+
+    records = [user.__dict__ for user in users]
+    statuses = await run_in_db_executor(upsert, user_statements, records)
+    for record in records:
+        user_cache.invalidate(record["ID"])
+        user_search.put(record)
+
+    return [{"index": i, "status": status} for i, status in enumerate(statuses)]
 
-    infos = []
-    for k, v in user.__dict__.items():
-        if v is None:
-            infos.append(f"{k} = NULL")
-        elif k in NUM_COLS["T_客戶"]:
-            infos.append(f"{k} = {v}")
-        else:
-            infos.append(f"{k} = N'{v}'")
 
-    sql = f"""
-        UPDATE PRAISE.dbo.T_客戶
-        SET {', '.join(infos)}, update_time = '{datetime.strftime(datetime.now(), '%Y-%m-%dT%H:%M:%S')}'
-        WHERE ID = '{user_id}'
+@app.post("/api/users/lookup", tags=["user"])
+async def lookup_users(user_ids: List[str]) -> UserLookup:
     """
+    Get the users with IDs in [user_ids] in T_客戶 in one request
 
-    exec_table(sql)
+    Found users are returned in request order, IDs with no user are listed
+    in missing.
+    """
+
+    check_lookup(user_ids)
+
+    found, missing = await run_in_db_executor(
+        lookup, user_statements, [(user_id,) for user_id in user_ids]
+    )
+
+    return lookup_response(User, found, [user_id for (user_id,) in missing])
 
 
 @app.get("/api/groups/", tags=["group"])
-def get_groups() -> List[Group]:
+async def get_groups(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+) -> List[Group]:
     """
     Get all groups in T_旅行團
+
+    Without [limit] every group is returned. With [limit], groups are returned
+    ordered by 出團日期 and the X-Next-Cursor response header holds the
+    [cursor] for the next page (absent on the last page). [fields] is a
+    comma-separated list of the columns to return, all of them by default.
     """
 
-    sql = "SELECT * FROM PRAISE.dbo.T_旅行團"
-    df = fetch_data(sql)
-    if df is None:
-        raise HTTPException(status_code=404, detail="No Group in DB.")
+    fields = parse_fields(Group, fields)
+    columns = group_statements.projection(fields, ("出團日期",))
 
-    sql2 = "SELECT 出團日期, COUNT(客戶ID) AS 客戶總數 FROM PRAISE.dbo.T_旅行團客戶 GROUP BY 出團日期"
-    df2 = fetch_data(sql2)
+    validators = await table_validators(
+        "T_旅行團", group_counts.version, request.url.query
+    )
+    if response := not_modified(request, *validators):
+        return response
+
+    headers = {}
+    if limit is None:
+        rows = await afetch_data(f"SELECT {columns} FROM PRAISE.dbo.T_旅行團")
+        if rows is None:
+            raise HTTPException(status_code=404, detail="No Group in DB.")
+    else:
+        if cursor is None:
+            sql = f"SELECT TOP (%d) {columns} FROM PRAISE.dbo.T_旅行團 ORDER BY 出團日期"
+            params = (limit + 1,)
+        else:
+            (last_date,) = decode_cursor(cursor, 1)
+            try:
+                last_date = datetime.fromisoformat(last_date)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}.")
+            sql = f"SELECT TOP (%d) {columns} FROM PRAISE.dbo.T_旅行團 WHERE 出團日期 > %s ORDER BY 出團日期"
+            params = (limit + 1, last_date)
 
-    merged_df = pd.merge(df, df2, on="出團日期", how="left")
-    merged_df["客戶總數"] = merged_df["客戶總數"].fillna(0)
+        rows, headers = page(await afetch_data(sql, params), limit, ("出團日期",))
 
-    output = []
-    for i in merged_df.index:
-        output.append({k: merged_df[k].iloc[i] for k in Group.__fields__.keys()})
+    if fields is None or "客戶總數" in fields:
+        for row in rows:
+            row["客戶總數"] = group_counts.get(row["出團日期"])
+    headers.update(validator_headers(*validators))
 
-    return output
+    return serializer(Group, fields).response(rows, headers=headers)
 
 
 @app.get("/api/group/", tags=["group"])
-def get_group_by_date(group_date: str) -> Group:
+async def get_group_by_date(request: Request, group_date: str) -> Group:
     """
     Get group with [group date] in T_旅行團
 
     param group_date: "YYYY-MM-DD"
     """
 
-    sql = f"SELECT * FROM PRAISE.dbo.T_旅行團 WHERE 出團日期 = '{group_date}'"
-    df = fetch_data(sql)
-    if df is None:
+    rows = await group_cache.get_or_load(
+        parse_group_date(group_date),
+        lambda: afetch_data(group_statements.select_by_key, (group_date,)),
+    )
+    if rows is None:
         raise HTTPException(
             status_code=404, detail=f"Group with date {group_date} not found."
         )
 
-    sql2 = f"SELECT 出團日期, COUNT(客戶ID) AS 客戶總數 FROM PRAISE.dbo.T_旅行團客戶 WHERE 出團日期 = '{group_date}' GROUP BY 出團日期"
-    df2 = fetch_data(sql2)
+    row = {**rows[0], "客戶總數": group_counts.get(rows[0]["出團日期"])}
 
-    if df2 is None:
-        merged_df = df
-        df["客戶總數"] = 0
-    else:
-        merged_df = pd.merge(df, df2, on="出團日期")
+    validators = row_validators("T_旅行團", row, row["客戶總數"])
+    if response := not_modified(request, *validators):
+        return response
 
-    output = {k: merged_df[k].iloc[0] for k in Group.__fields__.keys()}
-
-    return output
+    return serializer(Group).response_one(row, headers=validator_headers(*validators))
 
 
 @app.post("/api/group/", tags=["group"])
-def create_group(group: Group):
+async def create_group(group: Group):
     """
     Create new group in T_旅行團
     """
 
     group_date = group.__dict__["出團日期"]
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_旅行團 WHERE 出團日期 = '{group_date}'"
-    df = fetch_data(fetch_sql)
-    if df is not None:
+
+    data = group_statements.insert_params(group.__dict__, datetime.now())
+
+    if not await ainsert_data(group_statements.insert, data):
         raise HTTPException(
             status_code=404, detail=f"Group with date {group_date} already exists."
         )
-
-    cols = list(Group.__fields__.keys())
-    cols = [col for col in cols if col not in ["update_time", "客戶總數"]]
-    types = ",".join(["%d" if col in NUM_COLS["T_旅行團"] else "%s" for col in cols])
-    sql = f"""
-        INSERT INTO PRAISE.dbo.T_旅行團 ({", ".join(cols)}, add_time, add_user_id, update_time, update_user_id)
-        values ({types}, %s, %d, %s, %d)
-    """
-
-    data = [group.__dict__[k] for k in Group.__fields__.keys()]
-    data.extend([datetime.now(), 6, datetime.now(), 6])
-
-    insert_data(sql, data)
+    group_cache.invalidate(group_key(group_date))
+    rate_cache.invalidate(group_key(group_date))
+    group_event("created", group.__dict__)
 
 
 @app.delete("/api/group/", tags=["group"])
-def delete_group(group_date: str):
+async def delete_group(group_date: str):
     """
     Delete group with [group_date] in T_旅行團
 
     param group_date: "YYYY-MM-DD"
     """
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_旅行團 WHERE 出團日期 = '{group_date}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    parse_group_date(group_date)
+    if not await aexec_table(group_statements.delete, (group_date,)):
         raise HTTPException(
             status_code=404, detail=f"Group with date {group_date} not found."
         )
-
-    sql = f"DELETE FROM PRAISE.dbo.T_旅行團 WHERE 出團日期 = '{group_date}'"
-
-    exec_table(sql)
+    group_cache.invalidate(group_key(group_date))
+    rate_cache.invalidate(group_key(group_date))
+    invalidate_reports(group_date)
+    await run_in_db_executor(group_counts.refresh, group_date)
+    group_event("deleted", group_date=group_date)
 
 
 @app.put("/api/group/", tags=["group"])
-def update_group(group_date: str, group: Group):
+async def update_group(group_date: str, group: Group):
     """
     Update group with [group_date] in T_旅行團
 
@@ -264,193 +557,268 @@ def update_group(group_date: str, group: Group):
             detail=f"Group date {group_date} and {body_date} not matched.",
         )
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_旅行團 WHERE 出團日期 = '{group_date}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    data = group_statements.update_params(group.__dict__, [group_date], datetime.now())
+
+    if not await aexec_table(group_statements.update, data):
         raise HTTPException(
             status_code=404, detail=f"Group with date {group_date} not found."
         )
+    group_cache.invalidate(group_key(group_date))
+    rate_cache.invalidate(group_key(group_date))
+    invalidate_reports(group_date)
+    group_event("updated", group.__dict__)
 
-    infos = []
-    for k, v in group.__dict__.items():
-        if k in ["update_time", "客戶總數"]:
-            continue
-        if v is None:
-            infos.append(f"{k} = NULL")
-        elif k in NUM_COLS["T_旅行團"]:
-            infos.append(f"{k} = {v}")
-        else:
-            infos.append(f"{k} = N'{v}'")
 
-    sql = f"""
-        UPDATE PRAISE.dbo.T_旅行團
-        SET {', '.join(infos)}, update_time = '{datetime.strftime(datetime.now(), '%Y-%m-%dT%H:%M:%S')}'
-        WHERE 出團日期 = '{group_date}'
+@app.patch("/api/group/", tags=["group"])
+async def patch_group(group_date: str, group: GroupPatch) -> UpdateCount:
+    """
+    Update only the fields given for group with [group_date] in T_旅行團
+
+    Leaves the other columns alone, so edits do not overwrite concurrent
+    changes to other fields such as a settlement's totals.
+
+    param group_date: "YYYY-MM-DD"
+    """
+
+    changes, columns, updated = await patch_row(
+        group_statements, group, [parse_group_date(group_date)]
+    )
+    if not updated:
+        raise HTTPException(
+            status_code=404, detail=f"Group with date {group_date} not found."
+        )
+    group_cache.invalidate(group_key(group_date))
+    rate_cache.invalidate(group_key(group_date))
+    invalidate_reports(group_date)
+    event_broker.publish(
+        "groups", "patched", group_date, row=Serializer(Group, columns).record(changes)
+    )
+
+    return {"updated": updated}
+
+
+@app.post("/api/group/settle", tags=["group"])
+async def settle_group(group_date: str) -> Settlement:
+    """
+    Settle group with [group date] in T_旅行團
+
+    Computes every group user's deposits, net chips, commission and payout
+    and the group's 損_ totals, and writes them back in one transaction.
+
+    Quantities are valued at the group's rates, falling back to 預設匯率 as
+    in a conversion; a currency used without any rate is a 400.
+
+    param group_date: "YYYY-MM-DD"
+    """
+
+    parse_group_date(group_date)
+    try:
+        totals = await run_in_db_executor(settle, group_date)
+    except MissingRates as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No rate for 貨幣{', 貨幣'.join(map(str, e.currencies))} of group {group_date}.",
+        )
+    if totals is None:
+        raise HTTPException(
+            status_code=404, detail=f"Group with date {group_date} not found."
+        )
+    group_cache.invalidate(group_key(group_date))
+    invalidate_reports(group_date)
+    # every group user of the date changed, clients re-fetch the roster
+    group_event("settled", group_date=group_date)
+
+    return serializer(Settlement).response_one(totals)
+
+
+async def load_rates(group_date: str) -> Rates | None:
+    groups = await afetch_data(group_statements.select_by_key, (group_date,))
+    if groups is None:
+        return None
+    currencies = await afetch_data(currency_statements.select_all)
+
+    return Rates(groups[0], currencies or [])
+
+
+@app.post("/api/group/convert", tags=["group"])
+async def convert_amounts(group_date: str, conversion: Conversion) -> ConversionResult:
+    """
+    Convert [amounts] at the rates of group with [group date] in T_旅行團
+
+    Each row of amounts holds quantities of the group's 貨幣1..8 in order
+    (shorter rows are zero-padded, null counts as zero). Returns each row's
+    value in the main currency and in 新台幣, and their totals. 新台幣 values
+    are null when neither the group nor T_貨幣 has a 新台幣 rate.
+
+    param group_date: "YYYY-MM-DD"
     """
 
-    exec_table(sql)
+    rates = await rate_cache.get_or_load(
+        parse_group_date(group_date), lambda: load_rates(group_date)
+    )
+    if rates is None:
+        raise HTTPException(
+            status_code=404, detail=f"Group with date {group_date} not found."
+        )
+
+    width = max((len(row) for row in conversion.amounts), default=0)
+    if width > len(rates.vector):
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {len(rates.vector)} currencies per row, got {width}.",
+        )
+    amounts = np.zeros((len(conversion.amounts), width))
+    for i, row in enumerate(conversion.amounts):
+        amounts[i, : len(row)] = [0 if v is None else v for v in row]
+
+    if missing := rates.missing(amounts):
+        raise HTTPException(
+            status_code=400,
+            detail=f"No rate for 貨幣{', 貨幣'.join(map(str, missing))} of group {group_date}.",
+        )
+
+    main, twd = rates.convert(amounts)
+    content = {
+        "main": main,
+        "twd": twd,
+        "total_main": float(main.sum()),
+        "total_twd": None if twd is None else float(twd.sum()),
+    }
+
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+    )
 
 
 @app.get("/api/locations/", tags=["location"])
-def get_locations() -> list:
+async def get_locations() -> list:
     """
     Get all locations in T_地點
     """
 
-    sql = "SELECT * FROM PRAISE.dbo.T_地點"
-    df = fetch_data(sql)
+    rows = await afetch_data(location_statements.select_all)
 
-    if df is None:
+    if rows is None:
         raise HTTPException(status_code=404, detail="No Location in DB.")
 
-    output = []
-    for i in df.index:
-        output.append(df["地點"].iloc[i])
-        # output.append({k: df[k].iloc[i] for k in Location.__fields__.keys()})
+    output = [row["地點"] for row in rows]
 
     return output
 
 
 @app.post("/api/location/", tags=["location"])
-def create_location(location: Location):
+async def create_location(location: Location):
     """
     Create new location in T_地點
     """
 
     loc = location.__dict__["地點"]
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_地點 WHERE 地點 = N'{loc}'"
-    df = fetch_data(fetch_sql)
-    if df is not None:
-        raise HTTPException(status_code=404, detail=f"Location {loc} already exists.")
 
-    sql = "INSERT INTO PRAISE.dbo.T_地點 (地點) values (%s)"
-    data = [location.__dict__[k] for k in Location.__fields__.keys()]
-    insert_data(sql, data)
+    data = location_statements.insert_params(location.__dict__, datetime.now())
+
+    if not await ainsert_data(location_statements.insert, data):
+        raise HTTPException(status_code=404, detail=f"Location {loc} already exists.")
 
 
 @app.delete("/api/location/", tags=["location"])
-def delete_location(loc: str):
+async def delete_location(loc: str):
     """
     Delete location [loc] in T_地點
     """
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_地點 WHERE 地點 = N'{loc}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    if not await aexec_table(location_statements.delete, (loc,)):
         raise HTTPException(status_code=404, detail=f"Location {loc} not found.")
 
-    sql = f"DELETE FROM PRAISE.dbo.T_地點 WHERE 地點 = N'{loc}'"
-
-    exec_table(sql)
-
 
 @app.put("/api/location/", tags=["location"])
-def update_location(loc: str, location: Location):
+async def update_location(loc: str, location: Location):
     """
     Update location [loc] in T_地點
     """
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_地點 WHERE 地點 = N'{loc}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
-        raise HTTPException(status_code=404, detail=f"Location {loc} not found.")
-
-    new_loc = location.__dict__["地點"]
+    data = location_statements.update_params(location.__dict__, [loc], datetime.now())
 
-    sql = f"""
-        UPDATE PRAISE.dbo.T_地點
-        SET 地點 = N'{new_loc}'
-        WHERE 地點 = N'{loc}'
-    """
-
-    exec_table(sql)
+    if not await aexec_table(location_statements.update, data):
+        raise HTTPException(status_code=404, detail=f"Location {loc} not found.")
 
 
 @app.get("/api/currencies/", tags=["currency"])
-def get_currencies() -> List[Currency]:
+async def get_currencies(request: Request) -> List[Currency]:
     """
     Get all currencies in T_貨幣
     """
 
-    sql = "SELECT * FROM PRAISE.dbo.T_貨幣"
-    df = fetch_data(sql)
+    validators = await table_validators("T_貨幣", request.url.query)
+    if response := not_modified(request, *validators):
+        return response
 
-    if df is None:
-        raise HTTPException(status_code=404, detail="No Currency in DB.")
+    rows = await afetch_data(currency_statements.select_all)
 
-    output = []
-    for i in df.index:
-        output.append({k: df[k].iloc[i] for k in Currency.__fields__.keys()})
+    if rows is None:
+        raise HTTPException(status_code=404, detail="No Currency in DB.")
 
-    return output
+    return serializer(Currency).response(rows, headers=validator_headers(*validators))
 
 
 @app.get("/api/currency/", tags=["currency"])
-def get_currency_by_name(currency_name: str) -> Currency:
+async def get_currency_by_name(request: Request, currency_name: str) -> Currency:
     """
     Get currency with name [currency_name] in T_貨幣
     """
 
-    sql = f"SELECT * FROM PRAISE.dbo.T_貨幣 WHERE 貨幣名稱 = N'{currency_name}'"
-    df = fetch_data(sql)
-    if df is None:
+    rows = await currency_cache.get_or_load(
+        currency_name,
+        lambda: afetch_data(currency_statements.select_by_key, (currency_name,)),
+    )
+    if rows is None:
         raise HTTPException(
             status_code=404, detail=f"Currency with name {currency_name} not found"
         )
 
-    output = {k: df[k].iloc[0] for k in Currency.__fields__.keys()}
+    validators = row_validators("T_貨幣", rows[0])
+    if response := not_modified(request, *validators):
+        return response
 
-    return output
+    return serializer(Currency).response_one(rows[0], headers=validator_headers(*validators))
 
 
 @app.post("/api/currency/", tags=["currency"])
-def create_currency(currency: Currency):
+async def create_currency(currency: Currency):
     """
     Create new currency in T_貨幣
     """
 
     currency_name = currency.__dict__["貨幣名稱"]
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_貨幣 WHERE 貨幣名稱 = N'{currency_name}'"
-    df = fetch_data(fetch_sql)
-    if df is not None:
+
+    data = currency_statements.insert_params(currency.__dict__, datetime.now())
+
+    if not await ainsert_data(currency_statements.insert, data):
         raise HTTPException(
             status_code=404,
             detail=f"Currency with name {currency_name} already exists.",
         )
-
-    cols = list(Currency.__fields__.keys())
-    types = ",".join(["%d" if col in NUM_COLS["T_貨幣"] else "%s" for col in cols])
-    sql = f"""
-        INSERT INTO PRAISE.dbo.T_貨幣 ({", ".join(cols)}, add_time, add_user_id, update_time, update_user_id)
-        values ({types}, %s, %d, %s, %d)
-    """
-
-    data = [currency.__dict__[k] for k in Currency.__fields__.keys()]
-    data.extend([datetime.now(), 6, datetime.now(), 6])
-    insert_data(sql, data)
+    currency_cache.invalidate(currency_name)
+    rate_cache.clear()
 
 
 @app.delete("/api/currency/", tags=["currency"])
-def delete_currency(currency_name: str):
+async def delete_currency(currency_name: str):
     """
     Delete currency with name [currency_name] in T_貨幣
     """
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_貨幣 WHERE 貨幣名稱 = N'{currency_name}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    if not await aexec_table(currency_statements.delete, (currency_name,)):
         raise HTTPException(
             status_code=404,
             detail=f"Currency with name {currency_name} not found.",
         )
-
-    sql = f"DELETE FROM PRAISE.dbo.T_貨幣 WHERE 貨幣名稱 = N'{currency_name}'"
-
-    exec_table(sql)
+    currency_cache.invalidate(currency_name)
+    rate_cache.clear()
 
 
 @app.put("/api/currency/", tags=["currency"])
-def update_currency(currency_name: str, currency: Currency):
+async def update_currency(currency_name: str, currency: Currency):
     """
     Update currency with name [currency_name] in T_貨幣
     """
@@ -461,123 +829,159 @@ def update_currency(currency_name: str, currency: Currency):
             detail=f"Currency name {currency_name} and {currency.__dict__['貨幣名稱']} not matched.",
         )
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_貨幣 WHERE 貨幣名稱 = N'{currency_name}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    data = currency_statements.update_params(
+        currency.__dict__, [currency_name], datetime.now()
+    )
+
+    if not await aexec_table(currency_statements.update, data):
         raise HTTPException(
             status_code=404, detail=f"Currency with name {currency_name} not found."
         )
+    currency_cache.invalidate(currency_name)
+    rate_cache.clear()
 
-    infos = []
-    for k, v in currency.__dict__.items():
-        if v is None:
-            infos.append(f"{k} = NULL")
-        elif k in NUM_COLS["T_貨幣"]:
-            infos.append(f"{k} = {v}")
-        else:
-            infos.append(f"{k} = N'{v}'")
 
-    sql = f"""
-        UPDATE PRAISE.dbo.T_貨幣
-        SET {', '.join(infos)}, update_time = '{datetime.strftime(datetime.now(), '%Y-%m-%dT%H:%M:%S')}'
-        WHERE 貨幣名稱 = N'{currency_name}'
+@app.patch("/api/currency/", tags=["currency"])
+async def patch_currency(currency_name: str, currency: CurrencyPatch) -> UpdateCount:
+    """
+    Update only the fields given for currency with name [currency_name] in T_貨幣
     """
 
-    exec_table(sql)
+    _, _, updated = await patch_row(currency_statements, currency, [currency_name])
+    if not updated:
+        raise HTTPException(
+            status_code=404, detail=f"Currency with name {currency_name} not found."
+        )
+    currency_cache.invalidate(currency_name)
+    rate_cache.clear()
+
+    return {"updated": updated}
+
+
+# NULL names last, as the roster has always been shown
+GROUPUSER_ORDER = "ORDER BY CASE WHEN 姓名 IS NULL THEN 1 ELSE 0 END, 姓名, 客戶ID"
 
 
 @app.get("/api/groupusers/", tags=["group user"])
-def get_groupusers_by_date(group_date: str) -> List[GroupUser]:
+async def get_groupusers_by_date(
+    group_date: str,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+) -> List[GroupUser]:
     """
     Get group users with date [group_date] in T_旅行團客戶
+
+    Group users are sorted by (姓名, 客戶ID) with NULL names last. Without
+    [limit] every group user is returned. With [limit], the X-Next-Cursor
+    response header holds the [cursor]
+    for the next page (absent on the last page). [fields] is a
+    comma-separated list of the columns to return, all of them by default.
     """
 
-    sql = f"SELECT * FROM PRAISE.dbo.T_旅行團客戶 WHERE 出團日期 = '{group_date}'"
-    df = fetch_data(sql)
-    if df is None:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Group User date {group_date} not found.",
+    fields = parse_fields(GroupUser, fields)
+    columns = groupuser_statements.projection(fields, ("姓名", "客戶ID"))
+
+    if limit is None:
+        rows = await afetch_data(
+            f"SELECT {columns} FROM PRAISE.dbo.T_旅行團客戶 WHERE 出團日期 = %s {GROUPUSER_ORDER}",
+            (group_date,),
         )
+        if rows is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Group User date {group_date} not found.",
+            )
+
+        return serializer(GroupUser, fields).response(rows)
+
+    if cursor is None:
+        sql = f"""
+            SELECT TOP (%d) {columns} FROM PRAISE.dbo.T_旅行團客戶
+            WHERE 出團日期 = %s
+            {GROUPUSER_ORDER}
+        """
+        params = (limit + 1, group_date)
+    else:
+        last_name, last_id = decode_cursor(cursor, 2)
+        if not isinstance(last_name, (str, type(None))) or not isinstance(last_id, str):
+            raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}.")
+        if last_name is None:
+            after = "姓名 IS NULL AND 客戶ID > %s"
+            after_params = (last_id,)
+        else:
+            after = "姓名 IS NULL OR 姓名 > %s OR (姓名 = %s AND 客戶ID > %s)"
+            after_params = (last_name, last_name, last_id)
+        sql = f"""
+            SELECT TOP (%d) {columns} FROM PRAISE.dbo.T_旅行團客戶
+            WHERE 出團日期 = %s AND ({after})
+            {GROUPUSER_ORDER}
+        """
+        params = (limit + 1, group_date, *after_params)
 
-    df = df.sort_values("姓名").reset_index(drop=True)
-    output = []
-    for i in df.index:
-        output.append({k: df[k].iloc[i] for k in GroupUser.__fields__.keys()})
+    rows, headers = page(await afetch_data(sql, params), limit, ("姓名", "客戶ID"))
 
-    return output
+    return serializer(GroupUser, fields).response(rows, headers=headers)
 
 
 @app.get("/api/groupuser/", tags=["group user"])
-def get_groupuser_by_id_date(user_id: str, group_date: str) -> GroupUser:
+async def get_groupuser_by_id_date(user_id: str, group_date: str) -> GroupUser:
     """
     Get group user with ID[user_id] and date [group_date] in T_旅行團客戶
     """
 
-    sql = f"SELECT * FROM PRAISE.dbo.T_旅行團客戶 WHERE 客戶ID = '{user_id}' AND 出團日期 = '{group_date}'"
-    df = fetch_data(sql)
-    if df is None:
+    rows = await afetch_data(groupuser_statements.select_by_key, (group_date, user_id))
+    if rows is None:
         raise HTTPException(
             status_code=404,
             detail=f"Group User with ID {user_id} and date {group_date} not found.",
         )
 
-    output = {k: df[k].iloc[0] for k in GroupUser.__fields__.keys()}
-
-    return output
+    return serializer(GroupUser).response_one(rows[0])
 
 
 @app.post("/api/groupuser/", tags=["group user"])
-def create_groupuser(group_user: GroupUser):
+async def create_groupuser(group_user: GroupUser):
     """
     Create new group user in T_旅行團客戶
     """
 
     user_id = group_user.__dict__["客戶ID"]
     group_date = group_user.__dict__["出團日期"]
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_旅行團客戶 WHERE 客戶ID = '{user_id}' AND 出團日期 = '{group_date}'"
-    df = fetch_data(fetch_sql)
-    if df is not None:
+
+    data = groupuser_statements.insert_params(group_user.__dict__, datetime.now())
+
+    if not await ainsert_data(groupuser_statements.insert, data):
         raise HTTPException(
             status_code=404,
             detail=f"User with ID {user_id} and date {group_date} already exists.",
         )
-
-    cols = list(GroupUser.__fields__.keys())
-    types = ",".join(
-        ["%d" if col in NUM_COLS["T_旅行團客戶"] else "%s" for col in cols]
-    )
-    sql = f"""
-        INSERT INTO PRAISE.dbo.T_旅行團客戶 ({", ".join(cols)})
-        values ({types})
-    """
-
-    data = [group_user.__dict__[k] for k in GroupUser.__fields__.keys()]
-
-    insert_data(sql, data)
+    group_counts.add(group_date)
+    invalidate_reports(group_date)
+    groupuser_event("created", user_id, group_date, group_user.__dict__)
 
 
 @app.delete("/api/groupuser/", tags=["group user"])
-def delete_groupuser(user_id: str, group_date):
+async def delete_groupuser(user_id: str, group_date: str):
     """
     Delete group user with ID [user_id] and date [group_date] in T_旅行團客戶
+
+    param group_date: "YYYY-MM-DD"
     """
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_旅行團客戶 WHERE 客戶ID = '{user_id}' AND 出團日期 = '{group_date}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    day = parse_group_date(group_date)
+    if not await aexec_table(groupuser_statements.delete, (day, user_id)):
         raise HTTPException(
             status_code=404,
             detail=f"Group User with ID {user_id} and date {group_date} not found.",
         )
-
-    sql = f"DELETE FROM PRAISE.dbo.T_旅行團客戶 WHERE 客戶ID = '{user_id}' AND 出團日期 = '{group_date}'"
-
-    exec_table(sql)
+    group_counts.add(day, -1)
+    invalidate_reports(day)
+    groupuser_event("deleted", user_id, day)
 
 
 @app.put("/api/groupuser/", tags=["group user"])
-def update_groupuser(user_id: str, group_date: str, group_user: GroupUser):
+async def update_groupuser(user_id: str, group_date: str, group_user: GroupUser):
     """
     Update group user with ID [user_id] and date [group_date] in T_旅行團客戶
     """
@@ -593,30 +997,272 @@ def update_groupuser(user_id: str, group_date: str, group_user: GroupUser):
             detail=f"Group date {group_date} and {group_user.__dict__['出團日期']} not matched.",
         )
 
-    fetch_sql = f"SELECT * FROM PRAISE.dbo.T_旅行團客戶 WHERE 客戶ID = '{user_id}' AND 出團日期 = '{group_date}'"
-    df = fetch_data(fetch_sql)
-    if df is None:
+    data = groupuser_statements.update_params(
+        group_user.__dict__, [group_date, user_id], datetime.now()
+    )
+
+    if not await aexec_table(groupuser_statements.update, data):
         raise HTTPException(
             status_code=404,
             detail=f"Group User with ID {user_id} and date {group_date} not found.",
         )
+    invalidate_reports(group_date)
+    groupuser_event("updated", user_id, group_date, group_user.__dict__)
 
-    infos = []
-    for k, v in group_user.__dict__.items():
-        if v is None:
-            infos.append(f"{k} = NULL")
-        elif k in NUM_COLS["T_旅行團客戶"]:
-            infos.append(f"{k} = {v}")
-        else:
-            infos.append(f"{k} = N'{v}'")
 
-    sql = f"""
-        UPDATE PRAISE.dbo.T_旅行團客戶
-        SET {', '.join(infos)}
-        WHERE 客戶ID = '{user_id}' AND 出團日期 = '{group_date}'
+@app.patch("/api/groupuser/", tags=["group user"])
+async def patch_groupuser(user_id: str, group_date: str, group_user: GroupUserPatch) -> UpdateCount:
+    """
+    Update only the fields given for group user with ID [user_id] and date
+    [group_date] in T_旅行團客戶
     """
 
-    exec_table(sql)
+    changes, columns, updated = await patch_row(
+        groupuser_statements, group_user, [parse_group_date(group_date), user_id]
+    )
+    if not updated:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Group User with ID {user_id} and date {group_date} not found.",
+        )
+    invalidate_reports(group_date)
+    event_broker.publish(
+        "groupusers",
+        "patched",
+        group_date,
+        {"客戶ID": user_id},
+        Serializer(GroupUser, columns).record(changes),
+    )
+
+    return {"updated": updated}
+
+
+@app.post("/api/groupusers/bulk", tags=["group user"])
+async def bulk_upsert_groupusers(group_users: List[GroupUser]) -> List[BulkStatus]:
+    """
+    Create or update many group users in T_旅行團客戶 in one transaction
+
+    Returns the status of each group user by its position in the request.
+    """
+
+    check_bulk(group_users, ("客戶ID", "出團日期"))
+
+    records = [group_user.__dict__ for group_user in group_users]
+    statuses = await run_in_db_executor(upsert, groupuser_statements, records)
+    for record, status in zip(records, statuses):
+        if status == "created":
+            group_counts.add(record["出團日期"])
+    for group_date in {record["出團日期"] for record in records}:
+        invalidate_reports(group_date)
+    for record, status in zip(records, statuses):
+        groupuser_event(status, record["客戶ID"], record["出團日期"], record)
+
+    return [{"index": i, "status": status} for i, status in enumerate(statuses)]
+
+
+@app.post("/api/groupusers/lookup", tags=["group user"])
+async def lookup_groupusers(keys: List[GroupUserKey]) -> GroupUserLookup:
+    """
+    Get the group users with (客戶ID, 出團日期) in [keys] in T_旅行團客戶 in one
+    request
+
+    Found group users are returned in request order, keys with no group user
+    are listed in missing.
+    """
+
+    check_lookup(keys)
+
+    found, missing = await run_in_db_executor(
+        lookup, groupuser_statements, [(key.出團日期, key.客戶ID) for key in keys]
+    )
+
+    return lookup_response(
+        GroupUser,
+        found,
+        [{"客戶ID": user_id, "出團日期": date} for date, user_id in missing],
+    )
+
+
+@app.get("/api/reports/customers", tags=["report"])
+async def get_customer_report(
+    start: date | None = None, end: date | None = None
+) -> List[CustomerReport]:
+    """
+    Trips, deposits, chips, commission and payout per customer in
+    T_旅行團客戶, for groups from [start] to [end] inclusive (both optional)
+    """
+
+    rows = await get_report("customers", start, end)
+
+    return serializer(CustomerReport).response(rows)
+
+
+@app.get("/api/reports/introducers", tags=["report"])
+async def get_introducer_report(
+    start: date | None = None, end: date | None = None
+) -> List[IntroducerReport]:
+    """
+    Customers, trips, net chips and commission owed per 介紹人 in
+    T_旅行團客戶, for groups from [start] to [end] inclusive (both optional)
+    """
+
+    rows = await get_report("introducers", start, end)
+
+    return serializer(IntroducerReport).response(rows)
+
+
+@app.get("/api/reports/locations", tags=["report"])
+async def get_location_report(
+    start: date | None = None, end: date | None = None
+) -> List[LocationReport]:
+    """
+    Groups, trips, deposits, net chips and commission per 地點, for groups
+    from [start] to [end] inclusive (both optional)
+    """
+
+    rows = await get_report("locations", start, end)
+
+    return serializer(LocationReport).response(rows)
+
+
+@app.get("/api/reports/monthly", tags=["report"])
+async def get_monthly_report(
+    start: date | None = None, end: date | None = None
+) -> List[MonthlyReport]:
+    """
+    Groups, trips, deposits, net chips and commission per month, for groups
+    from [start] to [end] inclusive (both optional)
+    """
+
+    rows = await get_report("monthly", start, end)
+
+    return serializer(MonthlyReport).response(rows)
+
+
+@app.get("/api/events", tags=["event"])
+async def get_events(request: Request, group_date: str | None = None):
+    """
+    Stream changes of T_旅行團 (event "groups") and T_旅行團客戶 (event
+    "groupusers") as server-sent events, of [group_date] only if given
+
+    Each event's data is {"op", "出團日期", "客戶ID" for group users, "row"}
+    where op is created, updated, patched, deleted or settled (re-fetch the
+    roster) and row the new row without its null fields, or for patched
+    only the changed fields. An event "reset" means
+    events were missed and everything shown should be re-fetched.
+
+    param group_date: "YYYY-MM-DD"
+    """
+
+    if group_date is not None:
+        parse_group_date(group_date)
+
+    body = event_broker.stream(group_date, request.headers.get("last-event-id"))
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    return StreamingResponse(body, media_type="text/event-stream", headers=headers)
+
+
+@app.get("/admin/cache", tags=["admin"])
+async def get_cache_stats() -> dict:
+    """
+    Hit/miss/eviction counters of the read caches
+    """
+
+    return {cache.name: cache.stats() for cache in caches}
+
+
+@app.get("/admin/queries", tags=["admin"])
+async def get_query_stats(limit: int = Query(20, ge=1, le=1000)) -> dict:
+    """
+    Recent SQL statements grouped by normalised text, the [limit] largest by
+    total and by max duration
+    """
+
+    return query_log.top(limit)
+
+
+@app.get("/metrics", tags=["admin"])
+async def get_metrics():
+    """
+    Request latency, DB query and executor metrics in the Prometheus text format
+    """
+
+    content, media_type = render()
+
+    return Response(content, media_type=media_type)
+
+
+EXPORTS = {
+    "users": (
+        User,
+        f"SELECT {user_statements.projection()} FROM PRAISE.dbo.T_客戶 ORDER BY ID",
+    ),
+    "groups": (
+        Group,
+        f"""
+        SELECT {", ".join(f"g.{k}" for k in group_statements.read_columns)},
+            COALESCE(c.客戶總數, 0) AS 客戶總數
+        FROM PRAISE.dbo.T_旅行團 g
+        LEFT JOIN (
+            SELECT 出團日期, COUNT(客戶ID) AS 客戶總數
+            FROM PRAISE.dbo.T_旅行團客戶
+            GROUP BY 出團日期
+        ) c ON c.出團日期 = g.出團日期
+        ORDER BY g.出團日期
+        """,
+    ),
+    "groupusers": (
+        GroupUser,
+        f"""
+        SELECT {groupuser_statements.projection()} FROM PRAISE.dbo.T_旅行團客戶
+        ORDER BY 出團日期, 客戶ID
+        """,
+    ),
+}
+
+
+@app.get("/api/export/{table}", tags=["export"])
+async def export_table(
+    table: Literal["users", "groups", "groupusers"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    """
+    Stream every row of T_客戶 (users), T_旅行團 (groups) or T_旅行團客戶
+    (groupusers) as NDJSON or CSV
+
+    Rows are read from the DB in fixed-size batches and written out as they
+    arrive, so memory use does not depend on the table size. Exports use
+    their own DB connections, at most DB_STREAM_MAX_CONNECTIONS at a time,
+    and answer 503 when none frees up in time.
+    """
+
+    model, sql = EXPORTS[table]
+    rows_serializer = serializer(model)
+
+    # wait for a stream and the first batch before the response starts, so
+    # running out of streams is still answered with a status code
+    batches = astream_data(sql)
+    first = await anext(batches, None)
+
+    async def body():
+        if format == "csv":
+            yield "\ufeff".encode() + rows_serializer.csv_header()
+        try:
+            batch = first
+            while batch is not None:
+                if format == "csv":
+                    yield rows_serializer.csv(batch)
+                else:
+                    yield rows_serializer.ndjson(batch)
+                batch = await anext(batches, None)
+        finally:
+            await batches.aclose()
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
 
 
-app.mount("/", StaticFiles(directory="build", html=True), name="build")
+app.mount("/", static_assets, name="build")
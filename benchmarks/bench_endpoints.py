@@ -0,0 +1,258 @@
+"""
+Throughput, latency percentiles and peak RSS per endpoint, with the app
+running in-process against benchmarks/fake_db.py instead of SQL Server.
+
+    python benchmarks/bench_endpoints.py [--users N] [--groups N] [--groupusers N]
+        [--latency MS] [--requests N] [--concurrency C] [--only NAME,...]
+
+Requests are driven straight through the ASGI interface with the app's
+lifespan running, so the numbers cover routing, handlers, the DB executor
+and serialization but no HTTP server or socket. [latency] milliseconds are
+slept on every DB statement to stand in for the round trip to the server.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import orjson
+import psutil
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fake_db  # noqa: E402
+
+
+async def call(app, method: str, path: str, query: dict | None = None, body=None) -> tuple[int, int]:
+    """
+    One request through [app], returns (status, body size).
+    """
+
+    payload = b"" if body is None else orjson.dumps(body)
+    headers = [(b"host", b"bench")]
+    if body is not None:
+        headers.append((b"content-type", b"application/json"))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(query or {}).encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    received = False
+    status, size = None, 0
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # the client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+
+    return status, size
+
+
+class PeakRSS:
+    """
+    Samples the process RSS in a background thread while active.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_case(app, case: dict, requests: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = set()
+    sizes = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal sizes
+        for i in counter:
+            query = case["query"](i) if callable(case.get("query")) else case.get("query")
+            body = case["body"](i) if callable(case.get("body")) else case.get("body")
+            start = time.perf_counter()
+            status, size = await call(app, case["method"], case["path"], query, body)
+            latencies.append(time.perf_counter() - start)
+            statuses.add(status)
+            sizes += size
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "rps": requests / elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "rss": rss.peak / 2**20,
+        "bytes": sizes / requests,
+        "statuses": statuses,
+    }
+
+
+def build_cases(keys: dict) -> list[dict]:
+    user_ids = keys["user_ids"]
+    dates = [d.strftime("%Y-%m-%d") for d in keys["dates"]]
+    pick_user = lambda i: user_ids[(i * 7919) % len(user_ids)]  # noqa: E731
+    pick_date = lambda i: dates[(i * 31) % len(dates)]  # noqa: E731
+
+    return [
+        {"name": "users", "method": "GET", "path": "/api/users/"},
+        {"name": "users_page", "method": "GET", "path": "/api/users/", "query": {"limit": 100}},
+        {
+            "name": "user",
+            "method": "GET",
+            "path": "/api/user/",
+            "query": lambda i: {"user_id": pick_user(i)},
+        },
+        {
+            "name": "users_lookup",
+            "method": "POST",
+            "path": "/api/users/lookup",
+            "body": lambda i: [pick_user(i + k) for k in range(50)],
+        },
+        {
+            "name": "users_search",
+            "method": "GET",
+            "path": "/api/users/search",
+            "query": lambda i: {"q": pick_user(i)[: 2 + i % 3]},
+        },
+        {
+            "name": "user_update",
+            "method": "PUT",
+            "path": "/api/user/",
+            "query": lambda i: {"user_id": pick_user(i)},
+            "body": lambda i: {"ID": pick_user(i), "姓名": f"客戶{i}"},
+        },
+        {"name": "groups", "method": "GET", "path": "/api/groups/"},
+        {
+            "name": "groups_picker",
+            "method": "GET",
+            "path": "/api/groups/",
+            "query": {"fields": "出團日期,地點,客戶總數"},
+        },
+        {
+            "name": "group",
+            "method": "GET",
+            "path": "/api/group/",
+            "query": lambda i: {"group_date": pick_date(i)},
+        },
+        {
+            "name": "groupusers",
+            "method": "GET",
+            "path": "/api/groupusers/",
+            "query": lambda i: {"group_date": pick_date(i)},
+        },
+        {"name": "report_customers", "method": "GET", "path": "/api/reports/customers"},
+        {"name": "report_monthly", "method": "GET", "path": "/api/reports/monthly"},
+        {"name": "export_users", "method": "GET", "path": "/api/export/users"},
+        {"name": "export_groupusers", "method": "GET", "path": "/api/export/groupusers"},
+    ]
+
+
+# whole-table reads are run fewer times than the rest
+HEAVY = {"users", "groups", "export_users", "export_groupusers"}
+
+
+async def main_async(args, keys: dict) -> None:
+    import api
+
+    cases = build_cases(keys)
+    if args.only:
+        names = set(args.only.split(","))
+        cases = [case for case in cases if case["name"] in names]
+
+    print(
+        f"{'endpoint':<18} {'requests':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}"
+        f" {'KB/resp':>9} {'peak RSS MB':>12}  status"
+    )
+    async with api.app.router.lifespan_context(api.app):
+        for case in cases:
+            requests = max(1, args.requests // 20) if case["name"] in HEAVY else args.requests
+            result = await run_case(api.app, case, requests, args.concurrency)
+            print(
+                f"{case['name']:<18} {requests:>8} {result['rps']:>9.1f} {result['p50']:>8.2f}"
+                f" {result['p99']:>8.2f} {result['bytes'] / 1024:>9.1f} {result['rss']:>12.1f}"
+                f"  {','.join(map(str, sorted(result['statuses'])))}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--groupusers", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.0, help="ms per DB statement")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", help="comma-separated endpoint names")
+    args = parser.parse_args()
+
+    fake_db.install(latency=args.latency / 1000)
+    start = time.perf_counter()
+    keys = fake_db.seed(args.users, args.groups, args.groupusers)
+    print(
+        f"seeded {args.users} users, {args.groups} groups, {args.groupusers} group users"
+        f" in {time.perf_counter() - start:.1f}s, DB latency {args.latency}ms"
+    )
+
+    # the app serves ./build and reads nothing else from the working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "build"))
+        with open(os.path.join(workdir, "build", "index.html"), "w") as f:
+            f.write("<!doctype html>")
+        os.chdir(workdir)
+        asyncio.run(main_async(args, keys))
+
+
+if __name__ == "__main__":
+    main()
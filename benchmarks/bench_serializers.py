@@ -0,0 +1,85 @@
+"""
+Per-row cost of turning DB rows into a JSON response body.
+
+    python benchmarks/bench_serializers.py [--rows N] [--repeat R]
+
+"fastapi" is what the endpoints used to do: validate the rows against
+List[Model] and encode the result with json.dumps, like FastAPI's
+response_model path. "serializer" is serializers.Serializer.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, get_args
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from schema import User, Group, Currency, GroupUser  # noqa: E402
+from serializers import serializer  # noqa: E402
+
+
+def fake_value(annotation, i):
+    kind = [t for t in get_args(annotation) or (annotation,) if t is not type(None)][0]
+    if random.random() < 0.5 and type(None) in get_args(annotation):
+        return None
+    if kind is float:
+        return random.random() * 1000
+    if kind is int:
+        return random.randint(0, 100)
+    if kind is datetime:
+        return datetime(2020, 1, 1) + timedelta(days=i)
+    return f"v{i}"
+
+
+def fake_rows(model, n):
+    fields = model.model_fields
+    return [{k: fake_value(f.annotation, i) for k, f in fields.items()} for i in range(n)]
+
+
+def fastapi_path(model, rows):
+    adapter = TypeAdapter(List[model])
+    content = adapter.dump_python(adapter.validate_python(rows), mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def serializer_path(model, rows):
+    return serializer(model).dumps(rows)
+
+
+def bench(fn, model, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(model, rows)
+        best = min(best, time.perf_counter() - start)
+    return best / len(rows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'model':<10} {'fields':>6} {'fastapi us/row':>15} {'serializer us/row':>18} {'speedup':>8}")
+    for model in [User, Group, Currency, GroupUser]:
+        rows = fake_rows(model, args.rows)
+        assert json.loads(fastapi_path(model, rows)) == json.loads(serializer_path(model, rows))
+
+        before = bench(fastapi_path, model, rows, args.repeat)
+        after = bench(serializer_path, model, rows, args.repeat)
+        print(
+            f"{model.__name__:<10} {len(model.model_fields):>6} {before:>15.2f} {after:>18.2f} {before / after:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
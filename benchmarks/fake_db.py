@@ -0,0 +1,318 @@
+"""
+SQLite stand-in for the SQL Server the service talks to, for benchmarks.
+
+install() creates the tables from the schema models in a shared in-memory
+SQLite DB and swaps db.build_connection for connections to it, so the app
+runs unchanged. The T-SQL the app sends is translated just enough for
+SQLite (TOP (n), N'..' literals, lock hints). [latency] seconds are slept on
+every statement to stand in for the network round trip to the server.
+"""
+
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from schema import User, Group, Location, Currency, GroupUser  # noqa: E402
+
+DB_URI = "file:fake_praise?mode=memory&cache=shared"
+AUDIT = ["add_time timestamp", "add_user_id INTEGER", "update_time timestamp", "update_user_id INTEGER"]
+# table: (model, primary key, audited)
+TABLES = {
+    "T_客戶": (User, "ID", True),
+    "T_旅行團": (Group, "出團日期", True),
+    "T_地點": (Location, "地點", False),
+    "T_貨幣": (Currency, "貨幣名稱", True),
+    "T_旅行團客戶": (GroupUser, "客戶ID, 出團日期", False),
+}
+# model fields that are not columns
+COMPUTED = {"T_旅行團": {"update_time", "客戶總數"}}
+
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?")
+_TOP = re.compile(r"(\s*SELECT\s+)TOP \((\?|\d+)\)(.*)$", re.S | re.I)
+# statements/reconcile() reads column types from INFORMATION_SCHEMA
+_COLUMNS = """
+    SELECT m.name AS TABLE_NAME, p.name AS COLUMN_NAME,
+        CASE p.type
+            WHEN 'REAL' THEN 'float'
+            WHEN 'INTEGER' THEN 'int'
+            WHEN 'timestamp' THEN 'datetime'
+            ELSE 'nvarchar'
+        END AS DATA_TYPE
+    FROM sqlite_master m, pragma_table_info(m.name) p
+    WHERE m.type = 'table'
+"""
+
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(sep=" "))
+sqlite3.register_converter("timestamp", lambda v: datetime.fromisoformat(v.decode()))
+
+_keep = None
+
+
+def _type(annotation) -> str:
+    name = str(annotation)
+    if "datetime" in name:
+        return "timestamp"
+    if "float" in name:
+        return "REAL"
+    if "int" in name:
+        return "INTEGER"
+    return "TEXT"
+
+
+def translate(sql: str) -> str:
+    sql = sql.replace("PRAISE.dbo.", "")
+    sql = re.sub(r"(?<![\w'])N'", "'", sql)
+    sql = re.sub(r"WITH \((UPDLOCK|HOLDLOCK|,|\s)+\)", "", sql)
+    return sql.replace("%s", "?").replace("%d", "?")
+
+
+def _param(v):
+    # SQL Server compares '2025-02-20' to a datetime column as midnight
+    if isinstance(v, str) and _DATE.fullmatch(v):
+        return v + " 00:00:00"
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=None)
+    return v
+
+
+def _value(v):
+    # aggregates over timestamp columns lose their declared type
+    if isinstance(v, str) and _DATETIME.fullmatch(v):
+        return datetime.fromisoformat(v)
+    return v
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, params=None):
+        self._connection.wait()
+        if "INFORMATION_SCHEMA.COLUMNS" in sql:
+            sql, params = _COLUMNS, ()
+        sql = translate(sql)
+        params = [_param(v) for v in params or ()]
+
+        top = _TOP.match(sql)
+        if top:
+            n = params.pop(0) if top.group(2) == "?" else top.group(2)
+            sql = f"{top.group(1)}{top.group(3)} LIMIT {int(n)}"
+
+        self._cursor.execute(sql, params)
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, sql, seq_of_params):
+        self._connection.wait()
+        self._cursor.executemany(
+            translate(sql), [[_param(v) for v in params] for params in seq_of_params]
+        )
+        self.rowcount = self._cursor.rowcount
+
+    def fetchall(self):
+        return [tuple(_value(v) for v in row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [tuple(_value(v) for v in row) for row in self._cursor.fetchmany(size)]
+
+    def close(self):
+        self._cursor.close()
+
+
+class FakeConnection:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.raw = sqlite3.connect(
+            DB_URI,
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        # T-SQL date parts used by the reports, on SQLite's ISO text dates
+        self.raw.create_function("YEAR", 1, lambda v: int(v[:4]) if v else None)
+        self.raw.create_function("MONTH", 1, lambda v: int(v[5:7]) if v else None)
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def autocommit(self, status: bool):
+        if not status:
+            self.raw.execute("BEGIN")
+        elif self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+            self.raw.execute("BEGIN")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def close(self):
+        self.raw.close()
+
+
+def install(latency: float = 0.0) -> sqlite3.Connection:
+    """
+    Create the tables and point db.build_connection at them. Returns a
+    connection that keeps the in-memory DB alive, used for seeding.
+    """
+
+    global _keep
+
+    import db
+
+    if _keep is None:
+        _keep = sqlite3.connect(DB_URI, uri=True, check_same_thread=False)
+        for table, (model, key, audit) in TABLES.items():
+            computed = COMPUTED.get(table, set())
+            columns = [
+                f"{k} {_type(f.annotation)}"
+                for k, f in model.model_fields.items()
+                if k not in computed
+            ]
+            if audit:
+                columns += AUDIT
+            _keep.execute(f"CREATE TABLE {table} ({', '.join(columns)}, PRIMARY KEY ({key}))")
+            if table == "T_旅行團客戶":
+                _keep.execute(f"CREATE INDEX IX_{table}_出團日期 ON {table} (出團日期)")
+        _keep.commit()
+
+    db.build_connection = lambda: FakeConnection(latency)
+
+    return _keep
+
+
+def _columns(table: str) -> list[str]:
+    model, _, audit = TABLES[table]
+    computed = COMPUTED.get(table, set())
+    columns = [k for k in model.model_fields if k not in computed]
+
+    return columns + ([c.split()[0] for c in AUDIT] if audit else [])
+
+
+def _fill(table: str, rows: list[dict], now: datetime) -> list[tuple]:
+    columns = _columns(table)
+    audit_values = {"add_time": now, "add_user_id": 6, "update_time": now, "update_user_id": 6}
+    filled = []
+    for row in rows:
+        filled.append(tuple(row.get(k, audit_values.get(k)) for k in columns))
+
+    return filled
+
+
+def _insert(connection, table: str, rows: list[tuple]) -> None:
+    columns = _columns(table)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    connection.executemany(sql, [[_param(v) for v in row] for row in rows])
+
+
+def seed(users: int, groups: int, groupusers: int, seed: int = 0) -> dict:
+    """
+    Fill the tables with [users] customers, [groups] tour dates and
+    [groupusers] customers spread over those dates, with roughly the share
+    of NULLs the real data has. Returns sample keys for building requests.
+    """
+
+    if _keep is None:
+        raise RuntimeError("Call install() before seed().")
+
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    first_date = datetime(2010, 1, 1)
+    currencies = ["港幣", "新台幣", "台支", "人民幣", "美金", "日圓", "新幣", "馬幣"]
+
+    _insert(_keep, "T_地點", [(loc,) for loc in ["麗星郵輪", "澳門", "濟州", "越南"]])
+    _insert(
+        _keep,
+        "T_貨幣",
+        _fill(
+            "T_貨幣",
+            [
+                {"貨幣名稱": name, "貨幣代碼": None, "預設匯率": round(rng.uniform(0.1, 5), 4)}
+                for name in currencies
+            ],
+            now,
+        ),
+    )
+
+    user_ids = [f"{i:07d}" for i in range(users)]
+    rows = []
+    for i, user_id in enumerate(user_ids):
+        rows.append(
+            {
+                "ID": user_id,
+                "姓名": f"客戶{i}",
+                "性別": rng.choice(["男", "女", None]),
+                "生日": datetime(1950, 1, 1) + timedelta(days=rng.randrange(20000)),
+                "電話": f"02-{rng.randrange(10**8):08d}" if rng.random() < 0.5 else None,
+                "手機": f"09{rng.randrange(10**8):08d}",
+                "地址": f"台北市{i}號" if rng.random() < 0.3 else None,
+                "佣金比率A": rng.choice([0.5, 0.8, 1.0, None]),
+                "佣金比率B": rng.choice([0.5, 0.8, None]),
+                "介紹人": user_ids[rng.randrange(i)] if i and rng.random() < 0.3 else None,
+                "介紹人佣金比率A": rng.choice([0.1, 0.2, None]),
+            }
+        )
+        if len(rows) == 10000:
+            _insert(_keep, "T_客戶", _fill("T_客戶", rows, now))
+            rows = []
+    _insert(_keep, "T_客戶", _fill("T_客戶", rows, now))
+
+    dates = [first_date + timedelta(days=3 * i) for i in range(groups)]
+    rows = []
+    for date in dates:
+        row = {"出團日期": date, "地點": rng.choice(["麗星郵輪", "澳門", "濟州", "越南"])}
+        for n in range(1, 4):
+            row[f"貨幣{n}"] = currencies[n - 1]
+            row[f"匯率{n}"] = round(rng.uniform(0.1, 5), 4)
+        rows.append(row)
+    _insert(_keep, "T_旅行團", _fill("T_旅行團", rows, now))
+
+    # each date gets a distinct slice of customers, so keys never collide
+    per_group = min(max(1, groupusers // max(groups, 1)), max(users, 1))
+    rows = []
+    count = 0
+    for g, date in enumerate(dates):
+        for k in range(per_group):
+            if count == groupusers:
+                break
+            user_id = user_ids[(g * per_group + k) % len(user_ids)] if user_ids else f"{k:07d}"
+            row = {"客戶ID": user_id, "出團日期": date, "姓名": f"客戶{user_id}"}
+            for n in range(1, 4):
+                row[f"貨幣{n}_數量"] = rng.randrange(0, 100000, 100)
+            row["洗碼數A"] = rng.randrange(0, 10**6, 1000)
+            row["洗碼數B"] = rng.randrange(0, 10**6, 1000)
+            row["帳面餘額"] = rng.uniform(-10**5, 10**5)
+            rows.append(row)
+            count += 1
+            if len(rows) == 10000:
+                _insert(_keep, "T_旅行團客戶", _fill("T_旅行團客戶", rows, now))
+                rows = []
+    _insert(_keep, "T_旅行團客戶", _fill("T_旅行團客戶", rows, now))
+    _keep.commit()
+
+    return {
+        "user_ids": user_ids,
+        "dates": dates,
+        "busiest_date": dates[0] if dates else None,
+    }
@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from db import checkout_cursor, transaction
+from statements import Statements
+
+# SQL Server accepts at most 1000 rows per VALUES list and 2100 parameters
+MAX_INSERT_ROWS = 1000
+MAX_PARAMS = 2000
+
+
+def _norm(v):
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=None)
+    return v
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def select_by_keys(
+    cursor, table: str, keys: tuple[str, ...], values: list[tuple], columns: str
+) -> list[tuple]:
+    """
+    Rows of [columns] in [table] whose key is one of the tuples [values], in
+    one query per chunk. All key columns but the last are matched by
+    equality, the last one by IN (...), so each query is an index seek.
+    """
+
+    *fixed, free = keys
+    by_fixed = {}
+    for value in values:
+        by_fixed.setdefault(value[:-1], []).append(value[-1])
+
+    rows = []
+    for prefix, frees in by_fixed.items():
+        for chunk in _chunks(frees, MAX_PARAMS - len(prefix)):
+            where = [f"{k} = %s" for k in fixed]
+            where.append(f"{free} IN ({', '.join(['%s'] * len(chunk))})")
+            sql = f"SELECT {columns} FROM PRAISE.dbo.{table} WHERE {' AND '.join(where)}"
+            cursor.execute(sql, (*prefix, *chunk))
+            rows.extend(cursor.fetchall())
+
+    return rows
+
+
+def existing_keys(cursor, table: str, keys: tuple[str, ...], values: list[tuple]) -> set[tuple]:
+    """
+    Which of the key tuples [values] exist in [table].
+    """
+
+    rows = select_by_keys(cursor, table, keys, values, ", ".join(keys))
+
+    return {tuple(_norm(v) for v in row) for row in rows}
+
+
+def lookup(statements: Statements, values: list[tuple]) -> tuple[list[dict], list[tuple]]:
+    """
+    Fetch the rows of the table of [statements] whose key is one of the
+    tuples [values]. Returns the rows found, in the order of [values], and
+    the keys that do not exist.
+    """
+
+    values = list(dict.fromkeys(tuple(_norm(v) for v in value) for value in values))
+    if not values:
+        return [], []
+
+    columns = statements.read_columns
+    key_index = [columns.index(k) for k in statements.keys]
+
+    with checkout_cursor() as cursor:
+        rows = select_by_keys(
+            cursor,
+            statements.table,
+            statements.keys,
+            values,
+            statements.projection(),
+        )
+
+    by_key = {}
+    for row in rows:
+        by_key[tuple(_norm(row[i]) for i in key_index)] = dict(zip(columns, row))
+
+    found = [by_key[value] for value in values if value in by_key]
+    missing = [value for value in values if value not in by_key]
+
+    return found, missing
+
+
+def upsert(statements: Statements, records: list[dict]) -> list[str]:
+    """
+    Insert or update [records] in the table of [statements] inside one
+    transaction and return "created" or "updated" for each record.
+
+    Existence is checked with set-based queries, new rows go in through
+    multi-row INSERTs and existing rows are updated with executemany, with
+    the audit columns filled in like the single-row handlers do.
+    """
+
+    records = [{k: _norm(v) for k, v in record.items()} for record in records]
+    keys = statements.keys
+    key_values = [tuple(record[k] for k in keys) for record in records]
+    now = datetime.now()
+
+    with transaction() as cursor:
+        existing = existing_keys(cursor, statements.table, keys, key_values)
+        statuses = ["updated" if key in existing else "created" for key in key_values]
+
+        inserts = [r for r, s in zip(records, statuses) if s == "created"]
+        width = len(statements.insert_columns)
+        rows_per_insert = max(1, min(MAX_INSERT_ROWS, MAX_PARAMS // width))
+        for chunk in _chunks(inserts, rows_per_insert):
+            params = []
+            for record in chunk:
+                params.extend(statements.row_params(record, now))
+            cursor.execute(statements.insert_values(len(chunk)), tuple(params))
+
+        updates = [
+            tuple(statements.update_params(record, key, now))
+            for record, key, status in zip(records, key_values, statuses)
+            if status == "updated"
+        ]
+        if updates:
+            cursor.executemany(statements.update, updates)
+
+    return statuses
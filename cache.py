@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAXSIZE = int(os.environ.get("CACHE_MAXSIZE", 1024))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 60))
+CACHE_DISABLED = set(filter(None, os.environ.get("CACHE_DISABLED", "").split(",")))
+
+
+class LRUCache:
+    """
+    Bounded LRU cache whose entries also expire [ttl] seconds after being
+    stored. Misses are not cached.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = CACHE_MAXSIZE,
+        ttl: float = CACHE_TTL,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()  # {key: (expires_at, value)}
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached value for [key], or None.
+        """
+
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+    def set(self, key, value, token: int | None = None) -> None:
+        """
+        Store [value] under [key]. When [token] from token() is given, the
+        value is dropped if anything was invalidated since, as it may have
+        been read before that write.
+        """
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if token is not None and token != self._invalidations:
+                return
+
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def token(self) -> int:
+        return self._invalidations
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._data.pop(key, None)
+
+    def invalidate_if(self, predicate) -> None:
+        """
+        Drop every entry whose key satisfies [predicate].
+        """
+
+        with self._lock:
+            self._invalidations += 1
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._data.clear()
+
+    async def get_or_load(self, key, load):
+        """
+        Return the cached value for [key], or await [load]() and cache its
+        result unless it is None.
+        """
+
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        token = self.token()
+        value = await load()
+        if value is not None:
+            self.set(key, value, token)
+
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def build_cache(name: str) -> LRUCache:
+    return LRUCache(name, enabled=name not in CACHE_DISABLED)
+
+
+user_cache = build_cache("user")
+group_cache = build_cache("group")
+currency_cache = build_cache("currency")
+rate_cache = build_cache("rate")
+report_cache = build_cache("report")
+caches = [user_cache, group_cache, currency_cache, rate_cache, report_cache]
@@ -0,0 +1,147 @@
+import asyncio
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, zstd is not offered without it
+    zstandard = None
+
+# bodies below this are sent as is
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+# bodies above this are compressed on a worker thread instead of the event loop
+COMPRESS_THREAD_SIZE = int(os.environ.get("COMPRESS_THREAD_SIZE", 256 * 1024))
+COMPRESS_PREFIX = "/api/"
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def _compressors() -> dict:
+    # fast levels, these run per response
+    compressors = {}
+    if zstandard is not None:
+        compressors["zstd"] = zstandard.ZstdCompressor(level=3).compress
+    if brotli is not None:
+        compressors["br"] = lambda data: brotli.compress(data, quality=4)
+    compressors["gzip"] = lambda data: gzip.compress(data, 6, mtime=0)
+
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """
+    Preferred coding of COMPRESSORS the client accepts with q > 0, honouring
+    the client's q-values and then our order (zstd, br, gzip).
+    """
+
+    offers = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        offers[coding.lower()] = q
+
+    wildcard = offers.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in COMPRESSORS:
+        q = offers.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing /api/ responses of at least COMPRESS_MIN_SIZE
+    bytes with the best coding the client accepts.
+
+    Only complete bodies are compressed, streamed responses (the exports)
+    are passed through untouched. A compressed response's ETag is made weak
+    since its bytes differ from the uncompressed representation.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(COMPRESS_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        coding = negotiate(accept_encoding)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            body = message.get("body", b"")
+            headers = dict(start["headers"])
+            if (
+                message.get("more_body", False)
+                or b"content-encoding" in headers
+                or len(body) < COMPRESS_MIN_SIZE
+                or not headers.get(b"content-type", b"").decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                if start["status"] == 304:
+                    start = {**start, "headers": _weaken(start["headers"])}
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > COMPRESS_THREAD_SIZE:
+                body = await asyncio.to_thread(COMPRESSORS[coding], body)
+            else:
+                body = COMPRESSORS[coding](body)
+
+            response_headers = [
+                (k, v) for k, v in _weaken(start["headers"]) if k not in (b"content-length", b"vary")
+            ]
+            vary = headers.get(b"vary")
+            response_headers += [
+                (b"content-encoding", coding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send({**start, "headers": response_headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _weaken(headers: list) -> list:
+    return [
+        (k, b"W/" + v if k == b"etag" and not v.startswith(b"W/") else v)
+        for k, v in headers
+    ]
@@ -0,0 +1,76 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from db import afetch_data
+
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+
+def _to_utc(v: datetime) -> datetime:
+    # update_time is written as naive server-local time
+    return v.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_to_utc(last_modified), usegmt=True)
+
+    return headers
+
+
+def not_modified(
+    request: Request, etag: str, last_modified: datetime | None
+) -> Response | None:
+    """
+    304 response if the client's copy is still current, else None.
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag not in tags and "*" not in tags:
+            return None
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None or last_modified is None:
+            return None
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None or _to_utc(last_modified) > since:
+            return None
+
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+async def table_validators(table: str, *parts) -> tuple[str, None]:
+    """
+    ETag of a whole table from MAX(update_time) and the row count, plus any
+    [parts] the response also depends on.
+
+    There is no Last-Modified: deleting a row changes the table without
+    moving MAX(update_time) forward, so If-Modified-Since would go stale.
+    """
+
+    sql = f"SELECT MAX(update_time) AS last_modified, COUNT(*) AS total FROM PRAISE.dbo.{table}"
+    row = (await afetch_data(sql))[0]
+
+    return make_etag(table, row["last_modified"], row["total"], *parts), None
+
+
+def row_validators(table: str, row: dict, *parts) -> tuple[str, datetime | None]:
+    """
+    ETag of [row] from its update_time and any [parts] the response also
+    depends on. Last-Modified only when update_time alone decides the body,
+    as [parts] (e.g. a group's 客戶總數) change without touching it.
+    """
+
+    return make_etag(table, row["update_time"], *parts), None if parts else row["update_time"]
@@ -0,0 +1,49 @@
+import numpy as np
+
+CURRENCIES = range(1, 9)
+TWD = "新台幣"
+
+
+class Rates:
+    """
+    A group's conversion vector: the main-currency value of one unit of each
+    of its 貨幣1..8, and of one 新台幣. A currency without a group rate falls
+    back to its 預設匯率 in T_貨幣; NaN means there is no rate at all.
+    """
+
+    def __init__(self, group: dict, currencies: list[dict]):
+        defaults = {c["貨幣名稱"]: c["預設匯率"] for c in currencies}
+
+        names = [group[f"貨幣{i}"] for i in CURRENCIES]
+        rates = [group[f"匯率{i}"] for i in CURRENCIES]
+        rates = [
+            defaults.get(name) if rate is None and name is not None else rate
+            for name, rate in zip(names, rates)
+        ]
+        self.names = names
+        self.vector = np.array(rates, dtype=float)
+        self.vector.setflags(write=False)
+
+        twd = [rate for name, rate in zip(names, rates) if name == TWD and rate]
+        self.twd = twd[0] if twd else defaults.get(TWD) or None
+
+    def missing(self, amounts: np.ndarray) -> list[int]:
+        """
+        1-based currencies that [amounts] uses but that have no rate.
+        """
+
+        used = np.any(amounts != 0, axis=0)
+        k = amounts.shape[1]
+
+        return [i + 1 for i in np.flatnonzero(used & np.isnan(self.vector[:k]))]
+
+    def convert(self, amounts: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Main-currency and 新台幣 values of each row of [amounts], whose
+        columns are 貨幣1..k.
+        """
+
+        k = amounts.shape[1]
+        main = amounts @ np.nan_to_num(self.vector[:k])
+
+        return main, (main / self.twd if self.twd else None)
@@ -1,45 +1,530 @@
-import numpy as np
-import pandas as pd
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import pymssql
 
+import metrics
+from querylog import query_log
+
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+POOL_IDLE_TIMEOUT = float(os.environ.get("DB_POOL_IDLE_TIMEOUT", 300))
+POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+EXECUTOR_WORKERS = int(os.environ.get("DB_EXECUTOR_WORKERS", POOL_MAX_SIZE))
+STREAM_BATCH_SIZE = int(os.environ.get("DB_STREAM_BATCH_SIZE", 1000))
+# streams get their own connections outside the pool, this many at a time
+STREAM_MAX_CONNECTIONS = int(os.environ.get("DB_STREAM_MAX_CONNECTIONS", 2))
+
 
 def build_connection():
+    start = time.perf_counter()
     connection = pymssql.connect(
-        server="0.0.0.0", port=1433, user="SA", password="1qaz!QAZ"
+        server="0.0.0.0",
+        port=1433,
+        user="SA",
+        password="1qaz!QAZ",
+        autocommit=True,
     )
+    metrics.CONNECTION_SETUP.observe(time.perf_counter() - start)
 
     return connection
 
 
-def fetch_data(sql: str) -> pd.DataFrame:
-    connection = build_connection()
-    cursor = connection.cursor()
-    cursor.execute(sql)
+IntegrityError = pymssql.IntegrityError
 
-    fetch = cursor.fetchall()
-    if not len(fetch):
-        return None
 
-    df = pd.DataFrame(np.array(fetch), columns=np.array(cursor.description)[:, 0])
+class PoolTimeout(Exception):
+    pass
 
-    connection.close()
 
-    return df
+class ConnectionPool:
+    """
+    Bounded pool of DB connections.
 
+    Idle connections are reused LIFO so the warmest one is handed out first.
+    A connection idle for longer than [health_check_interval] is pinged with
+    `SELECT 1` on checkout, and one idle for longer than [idle_timeout] is
+    closed instead of reused (never going below [min_size]).
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size min={min_size} max={max_size}.")
+
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = []  # [(connection, last_used)]
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def open(self) -> None:
+        """
+        Eagerly create [min_size] connections.
+        """
+
+        with self._cond:
+            self._closed = False
+            missing = self.min_size - self._size
+            self._size += missing
+
+        for _ in range(missing):
+            try:
+                connection = self.connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self._release(connection)
+
+    def close(self) -> None:
+        """
+        Close every idle connection and refuse new checkouts. Connections in
+        use are closed when they are returned.
+        """
+
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed.")
+                    if self._idle:
+                        connection, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        connection, last_used = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No DB connection available within {self.timeout}s."
+                        )
+                    self._cond.wait(remaining)
+
+            if connection is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self._forget()
+                    raise
+
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout and self._size > self.min_size:
+                self._forget()
+                self._discard(connection)
+                continue
+            if idle_for > self.health_check_interval and not self._ping(connection):
+                self._forget()
+                self._discard(connection)
+                continue
+
+            return connection
+
+    def release(self, connection, broken: bool = False) -> None:
+        if broken:
+            self._forget()
+            self._discard(connection)
+            return
+
+        self._release(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of the block. Any exception
+        (including the block being abandoned mid-iteration) discards the
+        connection, since it may hold a pending result set or transaction.
+        """
+
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            self.release(connection, broken=True)
+            raise
+        self.release(connection)
+
+    def _release(self, connection) -> None:
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._cond.notify()
+                stale = [connection]
+            else:
+                now = time.monotonic()
+                self._idle.append((connection, now))
+                stale = []
+                while (
+                    self._size > self.min_size
+                    and now - self._idle[0][1] > self.idle_timeout
+                ):
+                    stale.append(self._idle.pop(0)[0])
+                    self._size -= 1
+                self._cond.notify()
+
+        for connection in stale:
+            self._discard(connection)
+
+    def _forget(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _ping(connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+pool = ConnectionPool(lambda: build_connection())
+_executor = None
+# streams run their driver calls here, so they neither wait behind nor
+# occupy the threads serving requests
+_stream_executor = None
+_stream_slots = None
+
+metrics.POOL_CONNECTIONS.labels("idle").set_function(lambda: pool.idle)
+metrics.POOL_CONNECTIONS.labels("in_use").set_function(lambda: pool.size - pool.idle)
+metrics.EXECUTOR_WORKERS.set(EXECUTOR_WORKERS)
+
+
+def open_db() -> None:
+    """
+    Warm up the pool and start the executor backing the async API.
+    """
+
+    global _executor, _stream_executor, _stream_slots
+
+    pool.open()
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=EXECUTOR_WORKERS, thread_name_prefix="db"
+        )
+    if _stream_executor is None:
+        _stream_executor = ThreadPoolExecutor(
+            max_workers=STREAM_MAX_CONNECTIONS, thread_name_prefix="db-stream"
+        )
+        _stream_slots = asyncio.Semaphore(STREAM_MAX_CONNECTIONS)
+
+
+def close_db() -> None:
+    global _executor, _stream_executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _stream_executor is not None:
+        _stream_executor.shutdown(wait=True)
+        _stream_executor = None
+    pool.close()
+
+
+async def run_in_db_executor(fn, *args):
+    """
+    Run blocking [fn] on the bounded DB executor. Waiting callers are queued
+    as futures rather than each holding a thread, so the number of blocking
+    driver calls in flight never exceeds EXECUTOR_WORKERS.
+    """
+
+    if _executor is None:
+        raise RuntimeError("DB executor is not running, call open_db() first.")
+
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    # popped by whichever comes first, the call starting or being abandoned
+    # while still queued, so the queued gauge is decremented exactly once
+    queued = [True]
+
+    def run():
+        _dequeue(queued)
+        metrics.EXECUTOR_BUSY.inc()
+        try:
+            return ctx.run(fn, *args)
+        finally:
+            metrics.EXECUTOR_BUSY.dec()
+
+    metrics.EXECUTOR_QUEUED.inc()
+    try:
+        return await loop.run_in_executor(_executor, run)
+    finally:
+        _dequeue(queued)
 
-def insert_data(sql: str, data: list) -> None:
-    connection = build_connection()
-    cursor = connection.cursor()
-    cursor.execute(sql, data)
 
-    connection.commit()
-    connection.close()
+def _dequeue(queued: list) -> None:
+    try:
+        queued.pop()
+    except IndexError:
+        return
+    metrics.EXECUTOR_QUEUED.dec()
 
 
-def exec_table(sql) -> None:
+def _observe(sql: str, params, seconds: float, rows: int, executions: int = 1) -> None:
+    metrics.observe_query(sql, seconds, rows)
+    query_log.record(sql, params, seconds, rows, executions)
+
+
+class ObservedCursor:
+    """
+    Cursor wrapper recording each statement like the helpers below do, for
+    code that drives a cursor itself. A statement with a result set is
+    recorded when its rows are fetched, any other once it has run.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql: str, params: tuple | None = None) -> None:
+        start = time.perf_counter()
+        if params is None:
+            self._cursor.execute(sql)
+        else:
+            self._cursor.execute(sql, params)
+        self._pending = (sql, params, start)
+        if self._cursor.description is None:
+            self._record(self._cursor.rowcount)
+
+    def executemany(self, sql: str, seq_of_params: list) -> None:
+        start = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_params)
+        _observe(
+            sql,
+            seq_of_params[0] if seq_of_params else None,
+            time.perf_counter() - start,
+            self._cursor.rowcount,
+            len(seq_of_params),
+        )
+
+    def fetchall(self) -> list:
+        rows = self._cursor.fetchall()
+        self._record(len(rows))
+        return rows
+
+    def _record(self, rows: int) -> None:
+        sql, params, start = self._pending
+        _observe(sql, params, time.perf_counter() - start, rows)
+
+
+@contextmanager
+def checkout_cursor():
+    """
+    Yield an ObservedCursor on a pooled connection for the duration of the
+    block.
+    """
+
+    with pool.connection() as connection:
+        yield ObservedCursor(connection.cursor())
+
+
+def fetch_data(sql: str, params: tuple | None = None) -> list[dict] | None:
+    """
+    Run [sql] and return its rows as dicts keyed by column name, or None if
+    there are no rows.
+    """
+
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, params)
+
+        fetch = cursor.fetchall()
+        _observe(sql, params, time.perf_counter() - start, len(fetch))
+        if not len(fetch):
+            return None
+
+        columns = [col[0] for col in cursor.description]
+
+    return [dict(zip(columns, row)) for row in fetch]
+
+
+def stream_data(sql: str, params: tuple | None = None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Run [sql] and yield its rows as lists of at most [batch_size] dicts, so
+    the full result set is never held in memory. The rows are read over a
+    connection of their own, not one of the pool, since a slow consumer
+    keeps it open until the generator is exhausted or closed.
+    """
+
     connection = build_connection()
-    cursor = connection.cursor()
-    cursor.execute(sql)
+    try:
+        cursor = connection.cursor()
+        # time spent in the driver only, not while the consumer holds a batch
+        elapsed, rows = 0.0, 0
+        try:
+            start = time.perf_counter()
+            if params is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(sql, params)
+            elapsed += time.perf_counter() - start
+
+            columns = [col[0] for col in cursor.description]
+            while True:
+                start = time.perf_counter()
+                fetch = cursor.fetchmany(batch_size)
+                elapsed += time.perf_counter() - start
+                if not fetch:
+                    break
+                rows += len(fetch)
+                yield [dict(zip(columns, row)) for row in fetch]
+        finally:
+            _observe(sql, params, elapsed, rows)
+    finally:
+        connection.close()
+
+
+def insert_data(sql: str, data: list) -> int:
+    """
+    Run [sql] with [data] and return the number of affected rows.
+    """
+
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        cursor.execute(sql, tuple(data))
+
+        connection.commit()
+        _observe(sql, data, time.perf_counter() - start, cursor.rowcount)
+
+    return cursor.rowcount
+
+
+@contextmanager
+def transaction():
+    """
+    Yield a cursor whose statements are committed together when the block
+    exits, or rolled back if it raises.
+    """
+
+    with pool.connection() as connection:
+        connection.autocommit(False)
+        try:
+            yield ObservedCursor(connection.cursor())
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.autocommit(True)
+
+
+def exec_table(sql, params: tuple | None = None) -> int:
+    """
+    Run [sql] and return the number of affected rows.
+    """
+
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, tuple(params))
+
+        connection.commit()
+        _observe(sql, params, time.perf_counter() - start, cursor.rowcount)
+
+    return cursor.rowcount
+
+
+async def afetch_data(sql: str, params: tuple | None = None) -> list[dict] | None:
+    return await run_in_db_executor(fetch_data, sql, params)
+
+
+async def astream_data(sql: str, params: tuple | None = None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Async variant of stream_data, each batch is fetched on the stream
+    executor. At most STREAM_MAX_CONNECTIONS streams run at once, others
+    wait up to DB_POOL_TIMEOUT for their turn and then raise PoolTimeout.
+    """
+
+    if _stream_executor is None:
+        raise RuntimeError("DB executor is not running, call open_db() first.")
+
+    try:
+        await asyncio.wait_for(_stream_slots.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"No DB stream available within {POOL_TIMEOUT}s.")
+
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    batches = stream_data(sql, params, batch_size)
+    try:
+        while True:
+            batch = await loop.run_in_executor(_stream_executor, ctx.run, next, batches, None)
+            if batch is None:
+                break
+            yield batch
+    finally:
+        await loop.run_in_executor(_stream_executor, batches.close)
+        _stream_slots.release()
+
+
+async def ainsert_data(sql: str, data: list) -> int:
+    return await run_in_db_executor(insert_data, sql, data)
+
 
-    connection.commit()
-    connection.close()
+async def aexec_table(sql, params: tuple | None = None) -> int:
+    return await run_in_db_executor(exec_table, sql, params)
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import uuid
+from collections import deque
+from datetime import date, datetime
+
+import orjson
+
+from group_counts import group_key
+
+# events a slow client may fall behind by before its stream is reset
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 1000))
+# recent events replayed to clients reconnecting with Last-Event-ID
+EVENTS_HISTORY = int(os.environ.get("EVENTS_HISTORY", 1000))
+# seconds of silence after which a comment is sent to keep proxies from
+# closing the stream
+EVENTS_KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE", 15))
+
+KEEPALIVE = b": keepalive\n\n"
+# the client missed events and has to re-fetch what it shows
+RESET = b"event: reset\ndata: {}\n\n"
+
+
+class Event:
+    def __init__(self, id: int, frame: bytes, group_date: datetime):
+        self.id = id
+        self.frame = frame
+        self.group_date = group_date
+
+
+class Subscription:
+    def __init__(self, group_date: datetime | None):
+        self.group_date = group_date
+        self.queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+
+    def wants(self, event: Event) -> bool:
+        return self.group_date is None or self.group_date == event.group_date
+
+
+class EventBroker:
+    """
+    Fans change events of groups and group users out to the clients of
+    /api/events, as server-sent events.
+
+    Events are published by the write handlers of this process, so like the
+    group user counts it assumes a single worker process writes the tables.
+    Every event has an id; a client reconnecting with the Last-Event-ID of
+    its last event gets what it missed replayed, or a reset event when that
+    is no longer known.
+    """
+
+    def __init__(self, history: int = EVENTS_HISTORY):
+        self._subscriptions = set()
+        self._history = deque(maxlen=history)
+        # tells ids from before a restart apart
+        self._instance = uuid.uuid4().hex[:8]
+        self._last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(
+        self,
+        table: str,
+        op: str,
+        group_date: str | date | datetime,
+        keys: dict | None = None,
+        row: dict | None = None,
+    ) -> None:
+        """
+        Send event [op] ("created", "updated", "deleted", ...) of [table] on
+        [group_date] to the clients following it. [keys] identify the row
+        within the date, [row] is its new JSON content if any.
+        """
+
+        day = group_key(group_date)
+        data = {"op": op, "出團日期": day.strftime("%Y-%m-%d"), **(keys or {})}
+        if row is not None:
+            data["row"] = row
+
+        self._last_id += 1
+        frame = (
+            f"id: {self._instance}-{self._last_id}\nevent: {table}\ndata: ".encode()
+            + orjson.dumps(data)
+            + b"\n\n"
+        )
+        event = Event(self._last_id, frame, day)
+        self._history.append(event)
+
+        for subscription in list(self._subscriptions):
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # too far behind, end its stream with a reset instead
+                self._subscriptions.discard(subscription)
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+
+    def _missed(self, subscription: Subscription, last_event_id: str | None) -> list[bytes] | None:
+        # frames after [last_event_id], None if some are no longer known
+        if not last_event_id:
+            return []
+        instance, _, last = last_event_id.partition("-")
+        if instance != self._instance or not last.isdigit():
+            return None
+        last = int(last)
+        oldest = self._history[0].id if self._history else self._last_id + 1
+        if last < oldest - 1 or last > self._last_id:
+            return None
+
+        return [e.frame for e in self._history if e.id > last and subscription.wants(e)]
+
+    async def stream(
+        self,
+        group_date: str | date | datetime | None = None,
+        last_event_id: str | None = None,
+    ):
+        """
+        The SSE body for a client following [group_date], every date if None.
+        """
+
+        subscription = Subscription(None if group_date is None else group_key(group_date))
+        # subscribing and reading the history happen without yielding to the
+        # event loop, so no event is either missed or sent twice
+        self._subscriptions.add(subscription)
+        missed = self._missed(subscription, last_event_id)
+        try:
+            yield b"retry: 3000\n\n" + (RESET if missed is None else b"".join(missed))
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                if event is None:
+                    yield RESET
+                    return
+                yield event.frame
+        finally:
+            self._subscriptions.discard(subscription)
+
+
+event_broker = EventBroker()
@@ -0,0 +1,76 @@
+import uuid
+from datetime import date, datetime
+
+from db import fetch_data
+
+
+def group_key(group_date: str | date | datetime) -> datetime:
+    """
+    Normalise a 出團日期 given as "YYYY-MM-DD", date or datetime.
+    """
+
+    if isinstance(group_date, str):
+        group_date = datetime.fromisoformat(group_date)
+    elif not isinstance(group_date, datetime):
+        group_date = datetime(group_date.year, group_date.month, group_date.day)
+
+    return group_date.replace(tzinfo=None)
+
+
+class GroupUserCounts:
+    """
+    Number of T_旅行團客戶 rows per 出團日期, kept in memory so listing groups
+    does not re-aggregate every group user ever recorded.
+
+    The index is built once on startup and then maintained by the group user
+    handlers of this process, so it assumes a single worker process writes
+    to T_旅行團客戶.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._instance = uuid.uuid4().hex
+        self._version = 0
+
+    @property
+    def version(self) -> tuple[str, int]:
+        """
+        Changes whenever any count may have changed, also across restarts.
+        """
+
+        return self._instance, self._version
+
+    def rebuild(self) -> None:
+        sql = "SELECT 出團日期, COUNT(客戶ID) AS 客戶總數 FROM PRAISE.dbo.T_旅行團客戶 GROUP BY 出團日期"
+        rows = fetch_data(sql) or []
+
+        self._counts = {group_key(row["出團日期"]): row["客戶總數"] for row in rows}
+        self._version += 1
+
+    def refresh(self, group_date) -> None:
+        """
+        Re-count a single date from the DB.
+        """
+
+        key = group_key(group_date)
+        sql = "SELECT COUNT(客戶ID) AS 客戶總數 FROM PRAISE.dbo.T_旅行團客戶 WHERE 出團日期 = %s"
+        rows = fetch_data(sql, (key,))
+
+        self._set(key, rows[0]["客戶總數"] if rows else 0)
+
+    def get(self, group_date) -> int:
+        return self._counts.get(group_key(group_date), 0)
+
+    def add(self, group_date, n: int = 1) -> None:
+        key = group_key(group_date)
+        self._set(key, self._counts.get(key, 0) + n)
+
+    def _set(self, key: datetime, count: int) -> None:
+        self._version += 1
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+
+
+group_counts = GroupUserCounts()
@@ -0,0 +1,109 @@
+import re
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+_TABLE = re.compile(r"PRAISE\.dbo\.(\w+)")
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being handled.",
+    ["method"],
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing DB statements and fetching their rows.",
+    ["table", "operation"],
+)
+QUERY_ROWS = Counter(
+    "db_query_rows_total",
+    "Rows returned or affected by DB statements.",
+    ["table", "operation"],
+)
+CONNECTION_SETUP = Histogram(
+    "db_connection_setup_seconds",
+    "Time spent opening new DB connections.",
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "DB connections held by the pool.",
+    ["state"],
+)
+EXECUTOR_BUSY = Gauge(
+    "db_executor_busy_workers",
+    "DB executor workers currently running a blocking call.",
+)
+EXECUTOR_QUEUED = Gauge(
+    "db_executor_queued_calls",
+    "Blocking DB calls waiting for a free executor worker.",
+)
+EXECUTOR_WORKERS = Gauge(
+    "db_executor_workers",
+    "Size of the DB executor.",
+)
+
+
+def statement_labels(sql: str) -> tuple[str, str]:
+    """
+    (table, operation) of [sql], from the first PRAISE.dbo table it names and
+    its leading keyword.
+    """
+
+    match = _TABLE.search(sql)
+    table = match.group(1) if match else "other"
+    words = sql.split(None, 1)
+    operation = words[0].upper() if words else "other"
+
+    return table, operation
+
+
+def observe_query(sql: str, seconds: float, rows: int) -> None:
+    labels = statement_labels(sql)
+    QUERY_DURATION.labels(*labels).observe(seconds)
+    if rows > 0:
+        QUERY_ROWS.labels(*labels).inc(rows)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request, labelled
+    with the route template (not the raw path) so the label set stays small.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                method, getattr(route, "path", None) or "other", str(status)
+            ).observe(time.perf_counter() - start)
+            in_progress.dec()
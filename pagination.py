@@ -0,0 +1,42 @@
+import base64
+import binascii
+
+import orjson
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Opaque cursor holding the sort key of the last row of a page.
+    """
+
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}.")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}.")
+
+    return values
+
+
+def page(rows: list[dict] | None, limit: int, key: tuple[str, ...]) -> tuple[list[dict], dict]:
+    """
+    Trim [rows] fetched with `TOP (limit + 1)` down to [limit] and return the
+    headers announcing the next page, if there is one.
+    """
+
+    rows = rows or []
+    if len(rows) <= limit:
+        return rows, {}
+
+    rows = rows[:limit]
+    return rows, {NEXT_CURSOR_HEADER: encode_cursor([rows[-1][k] for k in key])}
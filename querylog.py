@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import lru_cache
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 500))
+QUERY_LOG_SIZE = int(os.environ.get("QUERY_LOG_SIZE", 10000))
+
+logger = logging.getLogger(__name__)
+
+# ASGI scope of the request being handled, the route is resolved from it
+# when a query is recorded since routing happens after the middleware runs
+current_scope: ContextVar[dict | None] = ContextVar("current_scope", default=None)
+
+_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PARAM_LIST = re.compile(r"\(\s*%[sd](?:\s*,\s*%[sd])+\s*\)")
+_ROWS = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalise(sql: str) -> str:
+    """
+    [sql] with literals replaced by ?, IN lists and multi-row VALUES
+    collapsed, and whitespace squeezed, so statements that differ only in
+    values or batch size are grouped together.
+    """
+
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM_LIST.sub("(%s, ...)", sql)
+    sql = _ROWS.sub(r"\1, ...", sql)
+
+    return _SPACE.sub(" ", sql).strip()
+
+
+def current_route() -> str | None:
+    scope = current_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+
+    return getattr(route, "path", None) or scope.get("path")
+
+
+class QueryLog:
+    """
+    Ring buffer of the last [size] statements with their duration, row count
+    and calling route. Statements slower than [slow_ms] are also logged.
+    """
+
+    def __init__(self, size: int = QUERY_LOG_SIZE, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, params, seconds: float, rows: int, executions: int = 1) -> None:
+        """
+        [params] are those of one execution, [executions] how many times an
+        executemany ran [sql].
+        """
+
+        statement = normalise(sql)
+        ms = seconds * 1000
+        route = current_route()
+        with self._lock:
+            self._entries.append(
+                (statement, len(params) if params else 0, executions, ms, rows, route, time.time())
+            )
+
+        if ms >= self.slow_ms:
+            logger.warning(
+                "Slow query %.1f ms, %d rows, route %s: %s", ms, rows, route, statement
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def top(self, limit: int = 20) -> dict:
+        """
+        Recorded statements grouped by normalised text, the [limit] largest
+        by total and by max duration.
+        """
+
+        with self._lock:
+            entries = list(self._entries)
+
+        groups = {}
+        for statement, params, executions, ms, rows, route, _ in entries:
+            group = groups.get(statement)
+            if group is None:
+                group = groups[statement] = {
+                    "statement": statement,
+                    "count": 0,
+                    "executions": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "params": params,
+                    "routes": set(),
+                }
+            group["count"] += 1
+            group["executions"] += executions
+            group["total_ms"] += ms
+            group["max_ms"] = max(group["max_ms"], ms)
+            group["rows"] += max(rows, 0)
+            group["params"] = max(group["params"], params)
+            if route is not None:
+                group["routes"].add(route)
+
+        for group in groups.values():
+            group["mean_ms"] = group["total_ms"] / group["count"]
+            group["routes"] = sorted(group["routes"])
+
+        return {
+            "recorded": len(entries),
+            "slow_query_ms": self.slow_ms,
+            "by_total": sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)[:limit],
+            "by_max": sorted(groups.values(), key=lambda g: g["max_ms"], reverse=True)[:limit],
+        }
+
+
+class QueryContextMiddleware:
+    """
+    ASGI middleware making the current request's scope visible to the
+    query log, including from the DB executor threads.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+query_log = QueryLog()
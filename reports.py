@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta
+
+from cache import report_cache
+from db import afetch_data
+from group_counts import group_key
+
+# per report, an aggregate over T_旅行團客戶 (gu), joined to T_旅行團 (g)
+# where it needs group columns. Net chips are derived as a settlement does,
+# 淨洗碼數A/B defaulting to 洗碼數A/B, so unsettled groups report them too
+REPORTS = {
+    "customers": """
+        SELECT gu.客戶ID,
+            MAX(gu.姓名) AS 姓名,
+            COUNT(*) AS 出團次數,
+            COALESCE(SUM(gu.入金總額), 0) AS 入金總額,
+            COALESCE(SUM(gu.洗碼數A), 0) AS 洗碼數A,
+            COALESCE(SUM(gu.洗碼數B), 0) AS 洗碼數B,
+            COALESCE(SUM(
+                COALESCE(gu.淨洗碼數A, gu.洗碼數A, 0)
+                + COALESCE(gu.淨洗碼數B, gu.洗碼數B, 0)
+            ), 0) AS 淨洗碼數,
+            COALESCE(SUM(gu.佣金), 0) AS 佣金,
+            COALESCE(SUM(gu.客應領付總金額), 0) AS 客應領付總金額
+        FROM PRAISE.dbo.T_旅行團客戶 gu
+        {where}
+        GROUP BY gu.客戶ID
+        ORDER BY gu.客戶ID
+    """,
+    "introducers": """
+        SELECT gu.介紹人,
+            COUNT(DISTINCT gu.客戶ID) AS 客戶數,
+            COUNT(*) AS 出團次數,
+            COALESCE(SUM(COALESCE(gu.淨洗碼數A, gu.洗碼數A)), 0) AS 淨洗碼數A,
+            COALESCE(SUM(COALESCE(gu.淨洗碼數B, gu.洗碼數B)), 0) AS 淨洗碼數B,
+            COALESCE(SUM(
+                COALESCE(COALESCE(gu.淨洗碼數A, gu.洗碼數A) * gu.介紹人佣金比率A, 0)
+                + COALESCE(COALESCE(gu.淨洗碼數B, gu.洗碼數B) * gu.介紹人佣金比率B, 0)
+            ) / 100, 0) AS 介紹人佣金
+        FROM PRAISE.dbo.T_旅行團客戶 gu
+        {where} {and_} gu.介紹人 IS NOT NULL
+        GROUP BY gu.介紹人
+        ORDER BY gu.介紹人
+    """,
+    "locations": """
+        SELECT g.地點,
+            COUNT(DISTINCT gu.出團日期) AS 團數,
+            COUNT(*) AS 出團次數,
+            COALESCE(SUM(gu.入金總額), 0) AS 入金總額,
+            COALESCE(SUM(
+                COALESCE(gu.淨洗碼數A, gu.洗碼數A, 0)
+                + COALESCE(gu.淨洗碼數B, gu.洗碼數B, 0)
+            ), 0) AS 淨洗碼數,
+            COALESCE(SUM(gu.佣金), 0) AS 佣金
+        FROM PRAISE.dbo.T_旅行團客戶 gu
+        JOIN PRAISE.dbo.T_旅行團 g ON g.出團日期 = gu.出團日期
+        {where}
+        GROUP BY g.地點
+        ORDER BY g.地點
+    """,
+    "monthly": """
+        SELECT YEAR(gu.出團日期) AS 年,
+            MONTH(gu.出團日期) AS 月,
+            COUNT(DISTINCT gu.出團日期) AS 團數,
+            COUNT(*) AS 出團次數,
+            COALESCE(SUM(gu.入金總額), 0) AS 入金總額,
+            COALESCE(SUM(
+                COALESCE(gu.淨洗碼數A, gu.洗碼數A, 0)
+                + COALESCE(gu.淨洗碼數B, gu.洗碼數B, 0)
+            ), 0) AS 淨洗碼數,
+            COALESCE(SUM(gu.佣金), 0) AS 佣金
+        FROM PRAISE.dbo.T_旅行團客戶 gu
+        {where}
+        GROUP BY YEAR(gu.出團日期), MONTH(gu.出團日期)
+        ORDER BY 年, 月
+    """,
+}
+
+
+def report_sql(name: str, start: date | None, end: date | None) -> tuple[str, tuple]:
+    """
+    SQL and params of report [name] over 出團日期 from [start] to [end]
+    inclusive, either bound may be open.
+    """
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("gu.出團日期 >= %s")
+        params.append(datetime(start.year, start.month, start.day))
+    if end is not None:
+        conditions.append("gu.出團日期 < %s")
+        params.append(datetime(end.year, end.month, end.day) + timedelta(days=1))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    and_ = "AND" if conditions else "WHERE"
+
+    return REPORTS[name].format(where=where, and_=and_), tuple(params)
+
+
+async def get_report(name: str, start: date | None, end: date | None) -> list[dict]:
+    """
+    Rows of report [name] from [start] to [end], memoised per range until a
+    group user in the range is written.
+    """
+
+    async def load():
+        sql, params = report_sql(name, start, end)
+        return await afetch_data(sql, params) or []
+
+    return await report_cache.get_or_load((name, start, end), load)
+
+
+def invalidate_reports(group_date: str | date | datetime) -> None:
+    """
+    Drop the memoised reports whose range covers [group_date].
+    """
+
+    day = group_key(group_date).date()
+    report_cache.invalidate_if(
+        lambda key: (key[1] is None or key[1] <= day) and (key[2] is None or day <= key[2])
+    )
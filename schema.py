@@ -1,5 +1,7 @@
 from datetime import datetime
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, create_model
 
 
 class User(BaseModel):
@@ -285,3 +287,114 @@ class GroupUser(BaseModel):
             ]
         }
     }
+
+
+class BulkStatus(BaseModel):
+    index: int
+    status: Literal["created", "updated"]
+
+
+class GroupUserKey(BaseModel):
+    客戶ID: str
+    出團日期: datetime
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [{"客戶ID": "0001", "出團日期": "2025-02-20T00:00:00"}]
+        }
+    }
+
+
+class UserLookup(BaseModel):
+    found: list[User]
+    missing: list[str]
+
+
+class GroupUserLookup(BaseModel):
+    found: list[GroupUser]
+    missing: list[GroupUserKey]
+
+
+class Settlement(BaseModel):
+    出團日期: datetime
+    客戶數: int
+    損_公司總入金: float
+    損_總洗碼: float
+    損_淨洗碼: float
+    損_公司退佣: float
+
+
+class Conversion(BaseModel):
+    amounts: list[list[float | None]]
+
+    model_config = {
+        "json_schema_extra": {"examples": [{"amounts": [[1000, 400], [None, 200]]}]}
+    }
+
+
+class ConversionResult(BaseModel):
+    main: list[float]
+    twd: list[float] | None
+    total_main: float
+    total_twd: float | None
+
+
+class CustomerReport(BaseModel):
+    客戶ID: str
+    姓名: str | None = None
+    出團次數: int
+    入金總額: float
+    洗碼數A: float
+    洗碼數B: float
+    淨洗碼數: float
+    佣金: float
+    客應領付總金額: float
+
+
+class IntroducerReport(BaseModel):
+    介紹人: str
+    客戶數: int
+    出團次數: int
+    淨洗碼數A: float
+    淨洗碼數B: float
+    介紹人佣金: float
+
+
+class LocationReport(BaseModel):
+    地點: str | None = None
+    團數: int
+    出團次數: int
+    入金總額: float
+    淨洗碼數: float
+    佣金: float
+
+
+class MonthlyReport(BaseModel):
+    年: int
+    月: int
+    團數: int
+    出團次數: int
+    入金總額: float
+    淨洗碼數: float
+    佣金: float
+
+
+def partial(model: type[BaseModel]) -> type[BaseModel]:
+    """
+    [model] with every field optional, for PATCH bodies. Fields the client
+    left out are dropped by model_dump(exclude_unset=True).
+    """
+
+    fields = {k: (f.annotation | None, None) for k, f in model.model_fields.items()}
+
+    return create_model(f"{model.__name__}Patch", **fields)
+
+
+UserPatch = partial(User)
+GroupPatch = partial(Group)
+CurrencyPatch = partial(Currency)
+GroupUserPatch = partial(GroupUser)
+
+
+class UpdateCount(BaseModel):
+    updated: int
@@ -0,0 +1,298 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import islice
+
+from db import fetch_data
+from statements import user_statements
+
+SEARCH_FIELDS = ("ID", "姓名", "電話", "手機", "介紹人")
+# within exact, prefix and substring matches alike, hits in the user's own
+# fields rank before hits in the phone numbers before hits in 介紹人
+FIELD_GROUPS = (("ID", "姓名"), ("手機", "電話"), ("介紹人",))
+# phone numbers are matched on their digits only
+_PHONE_FIELDS = {"電話", "手機"}
+# share of a query's grams a fuzzy match must have
+FUZZY_MIN_OVERLAP = 0.6
+_NOT_ALNUM = re.compile(r"[^0-9a-z]")
+
+
+def normalise(value: str | None, phone: bool = False) -> str:
+    """
+    NFKC-folded (full-width digits and letters become ASCII), lower-cased,
+    whitespace-free text; only digits and letters for phone numbers.
+    """
+
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKC", value).lower()
+    if phone:
+        return _NOT_ALNUM.sub("", value)
+
+    return "".join(value.split())
+
+
+def grams(text: str) -> set[str]:
+    """
+    Characters and character bigrams of [text]. Working on characters rather
+    than words makes CJK names, which have no separators, searchable by any
+    part.
+    """
+
+    return set(text) | {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+def _query_grams(text: str) -> set[str]:
+    if len(text) == 1:
+        return {text}
+    return {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+class UserSearchIndex:
+    """
+    In-memory index over T_客戶's ID, 姓名, 電話, 手機 and 介紹人.
+
+    Per field, the users by exact value and the sorted distinct values answer
+    exact and prefix matches; an n-gram index answers substring and fuzzy
+    ones. Built once on startup and then kept current by the user handlers
+    of this process, so like the group user counts it assumes a single
+    worker process writes T_客戶.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        self._rows = {}  # {ID: row}
+        self._texts = {}  # {ID: {field: normalised text}}
+        self._values = {k: {} for k in SEARCH_FIELDS}  # {field: {text: {ID}}}
+        self._sorted = {k: [] for k in SEARCH_FIELDS}  # {field: sorted texts}
+        self._postings = {}  # {gram: {ID}}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def rebuild(self) -> None:
+        rows = fetch_data(user_statements.select_all) or []
+        with self._lock:
+            self._clear()
+            for row in rows:
+                self._add(row, keep_sorted=False)
+            for k, values in self._values.items():
+                self._sorted[k] = sorted(values)
+
+    def put(self, row: dict) -> None:
+        """
+        Index [row], replacing the user with the same ID.
+        """
+
+        with self._lock:
+            self._remove(row["ID"])
+            self._add(row)
+
+    def patch(self, user_id: str, changes: dict) -> None:
+        """
+        Apply [changes] to the indexed user [user_id], if known.
+        """
+
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is not None:
+                self._remove(user_id)
+                self._add({**row, **changes})
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            self._remove(user_id)
+
+    def _add(self, row: dict, keep_sorted: bool = True) -> None:
+        user_id = row["ID"]
+        texts = {k: normalise(row.get(k), k in _PHONE_FIELDS) for k in SEARCH_FIELDS}
+        self._rows[user_id] = {k: row.get(k) for k in user_statements.columns}
+        self._texts[user_id] = texts
+
+        for k, text in texts.items():
+            if not text:
+                continue
+            ids = self._values[k].get(text)
+            if ids is None:
+                ids = self._values[k][text] = set()
+                if keep_sorted:
+                    insort(self._sorted[k], text)
+            ids.add(user_id)
+
+        for gram in set().union(*(grams(text) for text in texts.values())):
+            self._postings.setdefault(gram, set()).add(user_id)
+
+    def _remove(self, user_id: str) -> None:
+        texts = self._texts.pop(user_id, None)
+        if texts is None:
+            return
+        del self._rows[user_id]
+
+        for k, text in texts.items():
+            ids = self._values[k].get(text)
+            if ids is None:
+                continue
+            ids.discard(user_id)
+            if not ids:
+                del self._values[k][text]
+                values = self._sorted[k]
+                del values[bisect_left(values, text)]
+
+        for gram in set().union(*(grams(text) for text in texts.values())):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, q: str, limit: int = 20) -> list[dict]:
+        """
+        Users matching every whitespace-separated term of [q] in any field,
+        ranked by the rarest term: exact matches before prefix matches before
+        substring matches. When that finds fewer than [limit] users and [q]
+        has CJK text, the rest is filled with fuzzy matches sharing most of
+        its n-grams.
+        """
+
+        tokens = [normalise(t) for t in q.split()]
+        tokens = [t for t in tokens if t]
+        if not tokens:
+            return []
+        terms = [(t, normalise(t, phone=True)) for t in tokens]
+
+        with self._lock:
+            ranked = self._ranked(terms, limit)
+
+            if len(ranked) < limit:
+                ranked += self._fuzzy("".join(tokens), set(ranked), limit - len(ranked))
+
+            return [self._rows[user_id] for user_id in ranked]
+
+    def _ranked(self, terms: list[tuple[str, str]], limit: int) -> list[str]:
+        # batches are consumed lazily, so a common prefix like "09" stops
+        # after [limit] users instead of collecting every phone number
+        if len(terms) == 1:
+            return list(islice(self._unique(self._batches(*terms[0])), limit))
+
+        # the rarest term ranks, the others filter, and the scan stops once
+        # every user that can match all of them was seen
+        matching = [self._matching(*term) for term in terms]
+        first = min(range(len(terms)), key=lambda i: len(matching[i]))
+        rest = terms[:first] + terms[first + 1 :]
+        possible = matching[first].intersection(*matching)
+        ranked, seen = [], 0
+        for user_id in self._unique(self._batches(*terms[first])):
+            if seen == len(possible):
+                break
+            if user_id not in possible:
+                continue
+            seen += 1
+            if all(self._contains(user_id, *term) for term in rest):
+                ranked.append(user_id)
+                if len(ranked) >= limit:
+                    break
+
+        return ranked
+
+    @staticmethod
+    def _unique(batches):
+        seen = set()
+        for batch in batches:
+            for user_id in batch:
+                if user_id not in seen:
+                    seen.add(user_id)
+                    yield user_id
+
+    def _batches(self, token: str, phone_token: str):
+        """
+        Sorted batches of matching IDs in rank order: exact matches, then
+        prefix matches by the matched value, then substring matches, each
+        by FIELD_GROUPS.
+        """
+
+        def term(k):
+            return phone_token if k in _PHONE_FIELDS else token
+
+        for fields in FIELD_GROUPS:
+            yield sorted(set().union(*(self._values[k].get(term(k), ()) for k in fields)))
+
+        for fields in FIELD_GROUPS:
+            for text, k in heapq.merge(*(self._prefixed(k, term(k)) for k in fields)):
+                if text != term(k):
+                    yield sorted(self._values[k][text])
+
+        candidates = self._matching(token, phone_token)
+        for fields in FIELD_GROUPS:
+            yield sorted(
+                user_id
+                for user_id in candidates
+                if self._contains(user_id, token, phone_token, fields)
+            )
+
+    def _matching(self, token: str, phone_token: str) -> set[str]:
+        # a superset of the users having [token] in any field
+        ids = self._containing(token)
+        if phone_token and phone_token != token:
+            ids = ids | self._containing(phone_token)
+
+        return ids
+
+    def _contains(self, user_id: str, token: str, phone_token: str, fields=SEARCH_FIELDS) -> bool:
+        texts = self._texts[user_id]
+        for k in fields:
+            t = phone_token if k in _PHONE_FIELDS else token
+            if t and t in texts[k]:
+                return True
+
+        return False
+
+    def _prefixed(self, k: str, text: str):
+        # (value, [k]) of the values of field [k] starting with [text], in order
+        if not text:
+            return
+        values = self._sorted[k]
+        # every value starting with [text] sorts before this one
+        end = text[:-1] + chr(ord(text[-1]) + 1)
+        for i in range(bisect_left(values, text), bisect_left(values, end)):
+            yield values[i], k
+
+    def _containing(self, text: str) -> set[str]:
+        # users having every gram of [text], a superset of those containing it
+        postings = sorted((self._postings.get(g, set()) for g in _query_grams(text)), key=len)
+        if not postings:
+            return set()
+
+        return postings[0].intersection(*postings[1:])
+
+    def _fuzzy(self, text: str, exclude: set, limit: int) -> list[str]:
+        # for mistyped names only: IDs and phone numbers are typed exactly,
+        # and their digit bigrams are shared by too many users to count
+        if text.isascii():
+            return []
+        # bigrams, plus single characters outside ASCII so a CJK name with
+        # one wrong character still shares most of its grams
+        wanted = _query_grams(text) | {c for c in text if not c.isascii()}
+        if len(wanted) < 2:
+            return []
+
+        overlap = Counter()
+        for gram in wanted:
+            overlap.update(self._postings.get(gram, ()))
+        threshold = len(wanted) * FUZZY_MIN_OVERLAP
+        matches = [
+            (count, user_id)
+            for user_id, count in overlap.items()
+            if count >= threshold and user_id not in exclude
+        ]
+        matches.sort(key=lambda m: (-m[0], m[1]))
+
+        return [user_id for _, user_id in matches[:limit]]
+
+
+user_search = UserSearchIndex()
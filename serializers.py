@@ -0,0 +1,148 @@
+import csv
+import io
+from contextvars import ContextVar
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Iterable, get_args
+from urllib.parse import parse_qs
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+
+# set per request from the omit_nulls query parameter, JSON bodies then
+# leave out keys whose value is null
+omit_nulls: ContextVar[bool] = ContextVar("omit_nulls", default=False)
+
+
+def _to_float(v):
+    return float(v)
+
+
+def _to_int(v):
+    return int(v)
+
+
+def _to_str(v):
+    return v if type(v) is str else str(v)
+
+
+def _to_datetime(v):
+    if isinstance(v, datetime):
+        return v
+    if isinstance(v, date):
+        return datetime(v.year, v.month, v.day)
+    return datetime.fromisoformat(v)
+
+
+_CONVERTERS = {
+    float: _to_float,
+    int: _to_int,
+    str: _to_str,
+    datetime: _to_datetime,
+}
+
+
+def _converter(annotation):
+    types = [t for t in get_args(annotation) or (annotation,) if t is not type(None)]
+
+    return _CONVERTERS[types[0]]
+
+
+class Serializer:
+    """
+    Converts DB rows into [model]'s JSON shape without building model
+    instances. Field order and value types follow the model's annotations, so
+    the output matches what FastAPI would produce after validating against
+    [model].
+    """
+
+    def __init__(self, model: type[BaseModel], fields: tuple[str, ...] | None = None):
+        self.model = model
+        self.fields = fields or tuple(model.model_fields)
+        self._converters = tuple(
+            (k, _converter(model.model_fields[k].annotation)) for k in self.fields
+        )
+
+    def record(self, row: dict) -> dict:
+        output = {}
+        for k, convert in self._converters:
+            v = row[k]
+            output[k] = None if v is None else convert(v)
+
+        return output
+
+    def compact_record(self, row: dict) -> dict:
+        output = {}
+        for k, convert in self._converters:
+            v = row[k]
+            if v is not None:
+                output[k] = convert(v)
+
+        return output
+
+    def json_record(self):
+        """
+        record or compact_record, as omit_nulls asks for this request.
+        """
+
+        return self.compact_record if omit_nulls.get() else self.record
+
+    def dumps(self, rows: Iterable[dict]) -> bytes:
+        record = self.json_record()
+        return orjson.dumps([record(row) for row in rows])
+
+    def dumps_one(self, row: dict) -> bytes:
+        return orjson.dumps(self.json_record()(row))
+
+    def ndjson(self, rows: Iterable[dict]) -> bytes:
+        record = self.json_record()
+        return b"".join(orjson.dumps(record(row)) + b"\n" for row in rows)
+
+    def csv_header(self) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(self.fields)
+        return buffer.getvalue().encode()
+
+    def csv(self, rows: Iterable[dict]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(self.record(row).values())
+        return buffer.getvalue().encode()
+
+    def response(self, rows: Iterable[dict], **kwargs) -> Response:
+        return Response(self.dumps(rows), media_type="application/json", **kwargs)
+
+    def response_one(self, row: dict, **kwargs) -> Response:
+        return Response(self.dumps_one(row), media_type="application/json", **kwargs)
+
+
+# bounded, [fields] is chosen by clients
+@lru_cache(maxsize=256)
+def serializer(model: type[BaseModel], fields: tuple[str, ...] | None = None) -> Serializer:
+    return Serializer(model, fields)
+
+
+class OmitNullsMiddleware:
+    """
+    ASGI middleware setting omit_nulls for requests with ?omit_nulls=true
+    (or 1), so null fields are dropped from the JSON they get back.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or b"omit_nulls=" not in scope["query_string"]:
+            await self.app(scope, receive, send)
+            return
+
+        params = parse_qs(scope["query_string"].decode("latin-1"))
+        value = params.get("omit_nulls", [""])[-1].lower()
+        token = omit_nulls.set(value in ("1", "true", "yes"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            omit_nulls.reset(token)
@@ -0,0 +1,179 @@
+from datetime import datetime
+
+import numpy as np
+
+from conversion import CURRENCIES, Rates
+from db import transaction
+from statements import currency_statements, group_statements, groupuser_statements
+
+
+# T_旅行團客戶 columns written by a settlement, besides the 貨幣i of the
+# currencies that have a rate. 淨洗碼數A/B are only read: writing back their
+# defaults would turn them into entered values that later changes to
+# 洗碼數A/B no longer reach
+SETTLED_COLUMNS = (
+    "入金總額",
+    "淨洗碼數",
+    "佣金",
+    "客應領付總金額",
+    "領款金額_其他",
+)
+# T_旅行團 totals written by a settlement
+TOTAL_COLUMNS = ("損_公司總入金", "損_總洗碼", "損_淨洗碼", "損_公司退佣")
+
+
+class MissingRates(Exception):
+    """
+    The roster holds quantities of [currencies] (1-based), which have
+    neither a group rate nor a 預設匯率.
+    """
+
+    def __init__(self, currencies: list[int]):
+        super().__init__(currencies)
+        self.currencies = currencies
+
+
+def _column(rows: list[dict], k: str) -> np.ndarray:
+    # None becomes NaN
+    return np.array([row[k] for row in rows], dtype=float)
+
+
+def _amount(rows: list[dict], k: str) -> np.ndarray:
+    return np.nan_to_num(_column(rows, k))
+
+
+def compute(rates: Rates, rows: list[dict]) -> tuple[dict, dict]:
+    """
+    Settle the roster [rows] of a group with [rates], vectorised over the
+    roster.
+
+    Per customer, 貨幣i is 貨幣i_數量 at the rate of currency i, the group's
+    匯率i or else its 預設匯率 as in a conversion, and 入金總額 their sum.
+    The 貨幣i of currencies without any rate are left as stored, and
+    MissingRates is raised if the roster has quantities or payouts in them.
+    淨洗碼數A/B keep an entered value and default to 洗碼數A/B, a default
+    that is re-derived on every settle since it is never stored. 佣金 is the
+    net chips at 佣金比率A/B percent, 客應領付總金額 is 帳面餘額 + 佣金 +
+    其他 - 客應付款項, and whatever of it is not paid out in 領款金額_貨幣i
+    (at the same rates) is left in 領款金額_其他.
+
+    Returns the settled columns as arrays and the group's 損_* totals.
+    """
+
+    quantities = np.column_stack([_amount(rows, f"貨幣{i}_數量") for i in CURRENCIES])
+    payouts = np.column_stack([_amount(rows, f"領款金額_貨幣{i}") for i in CURRENCIES])
+
+    if missing := rates.missing(np.vstack([quantities, payouts])):
+        raise MissingRates(missing)
+    rated = ~np.isnan(rates.vector)
+
+    amounts = quantities * rates.vector
+    deposit, _ = rates.convert(quantities)
+
+    chips_a = _amount(rows, "洗碼數A")
+    chips_b = _amount(rows, "洗碼數B")
+    net_a = _column(rows, "淨洗碼數A")
+    net_a = np.where(np.isnan(net_a), chips_a, net_a)
+    net_b = _column(rows, "淨洗碼數B")
+    net_b = np.where(np.isnan(net_b), chips_b, net_b)
+    net = net_a + net_b
+
+    commission = (
+        net_a * _amount(rows, "佣金比率A") + net_b * _amount(rows, "佣金比率B")
+    ) / 100
+    total = (
+        _amount(rows, "帳面餘額")
+        + commission
+        + _amount(rows, "其他")
+        - _amount(rows, "客應付款項")
+    )
+    other_payout = total - rates.convert(payouts)[0]
+
+    columns = {f"貨幣{i}": amounts[:, i - 1] for i in CURRENCIES if rated[i - 1]}
+    columns.update(
+        {
+            "入金總額": deposit,
+            "淨洗碼數A": net_a,
+            "淨洗碼數B": net_b,
+            "淨洗碼數": net,
+            "佣金": commission,
+            "客應領付總金額": total,
+            "領款金額_其他": other_payout,
+        }
+    )
+    totals = {
+        "損_公司總入金": float(deposit.sum()),
+        "損_總洗碼": float((chips_a + chips_b).sum()),
+        "損_淨洗碼": float(net.sum()),
+        "損_公司退佣": float(commission.sum()),
+    }
+
+    return columns, totals
+
+
+def _rows(cursor) -> list[dict]:
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def settle(group_date) -> dict | None:
+    """
+    Load the group with [group_date] and its roster, settle them and write
+    the results back in one transaction. The rows are locked from read to
+    write so concurrent edits are not lost. Returns the group's totals, or
+    None if there is no such group; raises MissingRates as compute does.
+    """
+
+    now = datetime.now()
+
+    with transaction() as cursor:
+        cursor.execute(
+            f"""
+            SELECT {group_statements.projection()}
+            FROM PRAISE.dbo.T_旅行團 WITH (UPDLOCK, HOLDLOCK)
+            WHERE 出團日期 = %s
+            """,
+            (group_date,),
+        )
+        groups = _rows(cursor)
+        if not groups:
+            return None
+        group = groups[0]
+
+        cursor.execute(
+            f"""
+            SELECT {groupuser_statements.projection()}
+            FROM PRAISE.dbo.T_旅行團客戶 WITH (UPDLOCK, HOLDLOCK)
+            WHERE 出團日期 = %s
+            """,
+            (group_date,),
+        )
+        rows = _rows(cursor)
+
+        totals = dict.fromkeys(TOTAL_COLUMNS, 0.0)
+        if rows:
+            cursor.execute(currency_statements.select_all)
+            columns, totals = compute(Rates(group, _rows(cursor)), rows)
+            settled = (
+                *(f"貨幣{i}" for i in CURRENCIES if f"貨幣{i}" in columns),
+                *SETTLED_COLUMNS,
+            )
+            values = np.column_stack([columns[k] for k in settled]).tolist()
+            cursor.executemany(
+                groupuser_statements.update_columns(settled),
+                [
+                    (*value, row["出團日期"], row["客戶ID"])
+                    for value, row in zip(values, rows)
+                ],
+            )
+
+        cursor.execute(
+            group_statements.update_columns(TOTAL_COLUMNS),
+            tuple(
+                group_statements.update_params(
+                    totals, [group["出團日期"]], now, TOTAL_COLUMNS
+                )
+            ),
+        )
+
+    return {"出團日期": group["出團日期"], "客戶數": len(rows), **totals}
@@ -0,0 +1,185 @@
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import get_args
+
+from pydantic import BaseModel
+
+from schema import User, Group, Location, Currency, GroupUser
+
+logger = logging.getLogger(__name__)
+
+AUDIT_COLUMNS = ["add_time", "add_user_id", "update_time", "update_user_id"]
+AUDIT_USER_ID = 6
+
+
+class Statements:
+    """
+    Parameterised SQL texts for one table, built once from its schema model.
+
+    Every value is passed as a parameter, so the statement text is the same
+    for every request and nothing is formatted into it at request time.
+    [keys] identify a row, and with [audit] the table carries add_time/
+    add_user_id/update_time/update_user_id, which are filled in on write.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        model: type[BaseModel],
+        keys: tuple[str, ...],
+        audit: bool = False,
+        exclude: tuple[str, ...] = (),
+    ):
+        self.table = table
+        self.model = model
+        self.keys = keys
+        self.audit = audit
+        self.columns = [k for k in model.model_fields if k not in exclude]
+        self.numeric_columns = [
+            k
+            for k in self.columns
+            if {int, float} & set(get_args(model.model_fields[k].annotation))
+        ]
+        self.set_columns = [k for k in self.columns if k not in keys] or list(keys)
+        self.insert_columns = self.columns + (AUDIT_COLUMNS if audit else [])
+        # update_time is read back for ETag/Last-Modified even when the model
+        # does not expose it
+        self.read_columns = self.columns + (["update_time"] if audit else [])
+
+        name = f"PRAISE.dbo.{table}"
+        where = " AND ".join(f"{k} = %s" for k in keys)
+        sets = [f"{k} = %s" for k in self.set_columns]
+        if audit:
+            sets.append("update_time = %s")
+
+        self.select_all = f"SELECT {self.projection()} FROM {name}"
+        self.select_by_key = f"SELECT {self.projection()} FROM {name} WHERE {where}"
+        self.insert = f"""
+            INSERT INTO {name} ({", ".join(self.insert_columns)})
+            SELECT {", ".join(["%s"] * len(self.insert_columns))}
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {name} WITH (UPDLOCK, HOLDLOCK) WHERE {where}
+            )
+        """
+        self.update = f"UPDATE {name} SET {', '.join(sets)} WHERE {where}"
+        self.delete = f"DELETE FROM {name} WHERE {where}"
+
+    # bounded, [fields] is chosen by clients
+    @lru_cache(maxsize=256)
+    def projection(
+        self, fields: tuple[str, ...] | None = None, extra: tuple[str, ...] = ()
+    ) -> str:
+        """
+        Column list selecting [fields] (every read column if None) and
+        [extra], in table order. Names that are not table columns are skipped.
+        """
+
+        wanted = set(self.read_columns if fields is None else fields) | set(extra)
+
+        return ", ".join(k for k in self.read_columns if k in wanted)
+
+    # bounded, PATCH bodies choose [columns]
+    @lru_cache(maxsize=256)
+    def update_columns(self, columns: tuple[str, ...]) -> str:
+        """
+        UPDATE of only [columns] of the row with the given key, plus
+        update_time when audited. Takes params in the order of update_params.
+        """
+
+        sets = [f"{k} = %s" for k in columns]
+        if self.audit:
+            sets.append("update_time = %s")
+        where = " AND ".join(f"{k} = %s" for k in self.keys)
+
+        return f"UPDATE PRAISE.dbo.{self.table} SET {', '.join(sets)} WHERE {where}"
+
+    @lru_cache(maxsize=None)
+    def insert_values(self, n: int) -> str:
+        """
+        Plain multi-row INSERT of [n] rows, for rows known to be new.
+        """
+
+        row = f"({', '.join(['%s'] * len(self.insert_columns))})"
+
+        return f"""
+            INSERT INTO PRAISE.dbo.{self.table} ({", ".join(self.insert_columns)})
+            VALUES {", ".join([row] * n)}
+        """
+
+    def key_params(self, record: dict) -> list:
+        return [record[k] for k in self.keys]
+
+    def row_params(self, record: dict, now: datetime) -> list:
+        params = [record[k] for k in self.columns]
+        if self.audit:
+            params.extend([now, AUDIT_USER_ID, now, AUDIT_USER_ID])
+
+        return params
+
+    def insert_params(self, record: dict, now: datetime) -> list:
+        return self.row_params(record, now) + self.key_params(record)
+
+    def update_params(
+        self, record: dict, key_values: list, now: datetime, columns: tuple[str, ...] | None = None
+    ) -> list:
+        params = [record[k] for k in (self.set_columns if columns is None else columns)]
+        if self.audit:
+            params.append(now)
+
+        return params + list(key_values)
+
+
+user_statements = Statements("T_客戶", User, ("ID",), audit=True)
+group_statements = Statements(
+    "T_旅行團", Group, ("出團日期",), audit=True, exclude=("update_time", "客戶總數")
+)
+location_statements = Statements("T_地點", Location, ("地點",))
+currency_statements = Statements("T_貨幣", Currency, ("貨幣名稱",), audit=True)
+groupuser_statements = Statements("T_旅行團客戶", GroupUser, ("出團日期", "客戶ID"))
+
+statements = [
+    user_statements,
+    group_statements,
+    location_statements,
+    currency_statements,
+    groupuser_statements,
+]
+
+
+def reconcile(fetch_data) -> None:
+    """
+    Compare the models' columns with INFORMATION_SCHEMA.COLUMNS and log any
+    column the DB does not have, or whose numeric-ness differs.
+    """
+
+    tables = ", ".join(f"'{s.table}'" for s in statements)
+    sql = f"""
+        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
+        FROM PRAISE.INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = 'dbo' AND TABLE_NAME IN ({tables})
+    """
+    try:
+        rows = fetch_data(sql) or []
+    except Exception as e:
+        logger.warning("Skipping schema reconciliation: %s", e)
+        return
+
+    numeric_types = {"int", "bigint", "smallint", "tinyint", "float", "real", "decimal", "numeric", "money"}
+    db_columns = {}
+    for row in rows:
+        db_columns.setdefault(row["TABLE_NAME"], {})[row["COLUMN_NAME"]] = row["DATA_TYPE"]
+
+    for s in statements:
+        columns = db_columns.get(s.table, {})
+        for k in s.insert_columns:
+            if k not in columns:
+                logger.warning("%s.%s is in the model but not in the DB", s.table, k)
+            elif k in s.columns and (columns[k] in numeric_types) != (k in s.numeric_columns):
+                logger.warning(
+                    "%s.%s is %s in the DB but %s in the model",
+                    s.table,
+                    k,
+                    columns[k],
+                    s.model.model_fields[k].annotation,
+                )
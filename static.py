@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from starlette.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+STATIC_DIR = os.environ.get("STATIC_DIR", "build")
+# files up to this size are kept in memory, larger ones are read from disk
+STATIC_MEMORY_LIMIT = int(os.environ.get("STATIC_MEMORY_LIMIT", 1024 * 1024))
+# smaller files are not worth compressing
+STATIC_MIN_COMPRESS_SIZE = 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+COMPRESSIBLE = {
+    ".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".wasm",
+}
+# bundler output like main.3f2a1b9c.js or index-B4x_Qz1c.css
+_HASHED = re.compile(r"[.-](?=[0-9A-Za-z_]*\d)[0-9A-Za-z_]{8,}\.\w+$")
+
+logger = logging.getLogger(__name__)
+
+
+def _accepted(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+
+    return accepted
+
+
+class Asset:
+    """
+    One file of the build, with its precompressed variants. Files up to the
+    memory limit are held in memory and compressed on load. Larger ones are
+    served from [path], and compressed only if the build shipped a .br/.gz
+    next to them, which is served from disk as well.
+    """
+
+    def __init__(self, path: str, url: str, memory_limit: int):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.cache_control = IMMUTABLE if _HASHED.search(url) else REVALIDATE
+
+        in_memory = self.size <= memory_limit
+        digest = hashlib.blake2b(digest_size=12)
+        with open(path, "rb") as f:
+            if in_memory:
+                data = f.read()
+                digest.update(data)
+            else:
+                data = None
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        self.etag = f'"{digest.hexdigest()}"'
+        self.body = data
+
+        # {coding: (body, etag, path)}, body None when served from path
+        self.variants = {}
+        extension = os.path.splitext(path)[1].lower()
+        if extension in COMPRESSIBLE and self.size >= STATIC_MIN_COMPRESS_SIZE:
+            self._add_variant(
+                "br", path + ".br", in_memory,
+                lambda: brotli.compress(data, quality=11) if brotli else None,
+            )
+            self._add_variant(
+                "gzip", path + ".gz", in_memory, lambda: gzip.compress(data, 9, mtime=0)
+            )
+
+    def _add_variant(self, coding: str, prebuilt: str, in_memory: bool, compress) -> None:
+        etag = f'"{self.etag[1:-1]}-{coding}"'
+        # variants produced at build time take precedence
+        if os.path.isfile(prebuilt):
+            if not in_memory:
+                if os.path.getsize(prebuilt) < self.size:
+                    self.variants[coding] = (None, etag, prebuilt)
+                return
+            with open(prebuilt, "rb") as f:
+                body = f.read()
+        elif in_memory:
+            body = compress()
+        else:
+            return
+        if body is not None and len(body) < self.size:
+            self.variants[coding] = (body, etag, prebuilt)
+
+    def etags(self) -> set[str]:
+        return {self.etag, *(etag for _, etag, _ in self.variants.values())}
+
+
+class StaticAssets:
+    """
+    ASGI app serving the SPA build from memory.
+
+    Every file is read and compressed once by load(). Responses are negotiated
+    on Accept-Encoding (br, then gzip) and carry an ETag. Hashed bundle files
+    are cached by browsers for a year; everything else, index.html
+    included, is revalidated on every use and answered 304 when unchanged.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR, memory_limit: int = STATIC_MEMORY_LIMIT):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self._assets = {}
+
+    def load(self) -> None:
+        assets = {}
+        if not os.path.isdir(self.directory):
+            logger.warning("Static directory %s not found, serving no frontend.", self.directory)
+            self._assets = assets
+            return
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith((".gz", ".br")) and os.path.isfile(path[:-3]):
+                    continue
+                url = "/" + os.path.relpath(path, self.directory).replace(os.sep, "/")
+                assets[url] = Asset(path, url, self.memory_limit)
+
+        for url in [url for url in assets if url.endswith("/index.html")]:
+            assets[url[: -len("index.html")]] = assets[url]
+
+        self._assets = assets
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"Allow": "GET, HEAD"})
+            await response(scope, receive, send)
+            return
+
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):] or "/"
+
+        asset = self._assets.get(path) or self._assets.get(path + "/")
+        if asset is None:
+            response = Response("Not Found", status_code=404, media_type="text/plain")
+            await response(scope, receive, send)
+            return
+
+        headers = {}
+        for key, value in scope["headers"]:
+            if key in (b"accept-encoding", b"if-none-match"):
+                headers[key] = value.decode("latin-1")
+
+        accepted = _accepted(headers.get(b"accept-encoding", ""))
+        coding = next((c for c in ("br", "gzip") if c in accepted and c in asset.variants), None)
+        body, etag, file_path = (
+            asset.variants[coding] if coding else (asset.body, asset.etag, asset.path)
+        )
+
+        response_headers = {"Cache-Control": asset.cache_control, "ETag": etag}
+        if asset.variants:
+            response_headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or asset.etags() & {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        ):
+            response = Response(status_code=304, headers=response_headers)
+            await response(scope, receive, send)
+            return
+
+        if coding:
+            response_headers["Content-Encoding"] = coding
+        if body is None:
+            response = FileResponse(
+                file_path, media_type=asset.media_type, headers=response_headers
+            )
+        else:
+            response = Response(body, media_type=asset.media_type, headers=response_headers)
+            if scope["method"] == "HEAD":
+                response.body = b""
+
+        await response(scope, receive, send)